@@ -0,0 +1,55 @@
+"""Benchmark the cost of importing getent in a fresh interpreter.
+
+Reports the median wall clock time of starting an interpreter that imports
+getent, against a bare interpreter, and the cost of the ``find_library`` and
+eager symbol binding that importing getent no longer does::
+
+    $ python benchmarks/import_time.py
+"""
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+REPEAT = 20
+
+CASES = (
+    ('interpreter', 'pass'),
+    ('import getent', 'import getent'),
+    ('import getent + lookup', 'import getent; getent.passwd(0)'),
+    ('find_library("c")', 'from ctypes import CDLL; '
+                          'from ctypes.util import find_library; '
+                          'CDLL(find_library("c"))'),
+)
+
+
+def measure(code):
+    """Return the median time in seconds to run `code` in a new process."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    for _ in range(REPEAT):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    """Run the benchmark and print a table."""
+    base = None
+    print('%-24s %10s %10s' % ('case', 'median ms', 'extra ms'))
+    for name, code in CASES:
+        elapsed = measure(code)
+        if base is None:
+            base = elapsed
+        print('%-24s %10.1f %10.1f' % (
+            name, elapsed * 1e3, (elapsed - base) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
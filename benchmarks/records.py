@@ -0,0 +1,113 @@
+"""Benchmark record construction, per record type.
+
+Compares the precompiled record classes with the ``dir()`` based reflection
+they replaced, by building records from the same struct over and over::
+
+    $ python benchmarks/records.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import getent  # noqa: E402
+from getent import reentrant  # noqa: E402
+from getent.constants import c_char_p  # noqa: E402
+
+NUMBER = 20000
+
+
+class LegacyStructMap(object):
+
+    """Record construction as it was done by reflecting on the struct."""
+
+    def __init__(self, p):
+        if hasattr(p, 'contents'):
+            self.p = p.contents
+        else:
+            self.p = p
+
+        for attr in dir(self.p):
+            if attr.startswith('_'):
+                continue
+
+            elif not hasattr(self, attr):
+                value = getattr(self.p, attr)
+                setattr(self, attr, getent.convert23(value))
+
+    def _map(self, attr):
+        i = 0
+        obj = getattr(self.p, attr)
+        while obj[i]:
+            yield getent.convert23(obj[i])
+            i += 1
+
+
+class LegacyAliases(LegacyStructMap):
+
+    """Records with an ``aliases`` list."""
+
+    def __init__(self, p):
+        super(LegacyAliases, self).__init__(p)
+        self.aliases = list(self._map('aliases'))
+
+
+class LegacyGroup(LegacyStructMap):
+
+    """Group records with a ``members`` list."""
+
+    def __init__(self, p):
+        super(LegacyGroup, self).__init__(p)
+        self.members = list(self._map('members'))
+
+
+class LegacyHost(LegacyAliases):
+
+    """Host records with resolved addresses."""
+
+    def __init__(self, p):
+        super(LegacyHost, self).__init__(p)
+        self.addresses = [getent._resolve(self.p.addrtype, addr)
+                          for addr in self._map('addr_list')]
+
+
+SAMPLES = (
+    ('Passwd', getent.Passwd, LegacyStructMap,
+     lambda: reentrant.getpwnam(c_char_p('root'))),
+    ('Group', getent.Group, LegacyGroup,
+     lambda: reentrant.getgrnam(c_char_p('root'))),
+    ('Host', getent.Host, LegacyHost,
+     lambda: reentrant.gethostbyname2(c_char_p('localhost'), getent.AF_INET)),
+    ('Proto', getent.Proto, LegacyAliases,
+     lambda: reentrant.getprotobyname(c_char_p('tcp'))),
+    ('RPC', getent.RPC, LegacyAliases,
+     lambda: reentrant.getrpcbyname(c_char_p('portmapper'))),
+    ('Service', getent.Service, LegacyAliases,
+     lambda: reentrant.getservbyname(c_char_p('ssh'), c_char_p('tcp'))),
+    ('Shadow', getent.Shadow, LegacyStructMap,
+     lambda: reentrant.getspnam(c_char_p('root'))),
+)
+
+
+def main():
+    """Run the benchmark and print a table."""
+    print('%-8s %12s %12s %8s' % ('record', 'legacy us', 'compiled us',
+                                  'speedup'))
+    for name, cls, legacy, lookup in SAMPLES:
+        p = lookup()
+        if not p:
+            print('%-8s %12s' % (name, 'no sample'))
+            continue
+
+        old = min(timeit.repeat(lambda: legacy(p), number=NUMBER, repeat=3))
+        new = min(timeit.repeat(lambda: cls(p), number=NUMBER, repeat=3))
+        print('%-8s %12.2f %12.2f %7.1fx' % (
+            name, old / NUMBER * 1e6, new / NUMBER * 1e6, old / new))
+
+
+if __name__ == '__main__':
+    main()
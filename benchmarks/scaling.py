@@ -0,0 +1,282 @@
+"""Benchmark how lookups scale with the size of the databases.
+
+Generates synthetic ``etc/passwd``, ``etc/group``, ``etc/services`` and
+``etc/hosts`` files of every size, and measures single lookup latency,
+enumeration throughput and peak memory against them::
+
+    $ python benchmarks/scaling.py --sizes 1000,10000,100000 --output out.json
+
+The files are served through every backend that is available:
+
+``files``
+    :class:`getent.files.Files` reading the fixture directory
+``store``
+    :class:`getent.store.Store` on a snapshot written from the fixture
+``nss``
+    the libc lookups of the :mod:`getent` module, with `nss_wrapper`_
+    preloaded to serve the fixture; skipped if nss_wrapper is not
+    installed, set ``NSS_WRAPPER_LIB`` to point at it. nss_wrapper does
+    not wrap services, so those are not measured for this backend.
+
+Every backend runs in its own interpreter. The results are written as
+JSON, one entry per backend, size, function and metric. A backend that was
+skipped gets a single entry per size, with the reason under ``skipped``.
+
+Only the four databases above are measured. The files and store backends
+do not serve the shadow, proto, rpc, network and alias databases, and
+nss_wrapper does not wrap them, so there is nothing to compare them with.
+Peak memory is measured with :mod:`tracemalloc`, which only sees the
+memory Python allocates: what libc and the NSS modules allocate for
+lookups, and the memory map of a store, are not counted.
+
+.. _nss_wrapper: https://cwrap.org/nss_wrapper.html
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+SIZES = (1000, 10000, 100000)
+BACKENDS = ('files', 'store', 'nss')
+
+#: Number of single lookups per function, a tenth of them misses
+LOOKUPS = 1000
+
+#: Number of runs of which the fastest enumeration is reported
+REPEAT = 3
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def generate(root, size):
+    """Write databases of `size` entries below `root`."""
+    etc = os.path.join(root, 'etc')
+    os.makedirs(etc)
+    with open(os.path.join(etc, 'passwd'), 'w') as handle:
+        for i in range(size):
+            handle.write('user%d:x:%d:%d:User %d:/home/user%d:/bin/sh\n' % (
+                i, 10000 + i, 10000 + i % 1000, i, i))
+
+    with open(os.path.join(etc, 'group'), 'w') as handle:
+        for i in range(size):
+            members = ','.join('user%d' % ((i + j) % size) for j in range(3))
+            handle.write('group%d:x:%d:%s\n' % (i, 10000 + i, members))
+
+    with open(os.path.join(etc, 'services'), 'w') as handle:
+        for i in range(size):
+            handle.write('service%d\t%d/%s\talias%d\n' % (
+                i, 1024 + i // 2 % 64000, ('tcp', 'udp')[i % 2], i))
+
+    with open(os.path.join(etc, 'hosts'), 'w') as handle:
+        for i in range(size):
+            handle.write('10.%d.%d.%d\thost%d.example.org\thost%d\n' % (
+                i >> 16 & 255, i >> 8 & 255, i & 255, i, i))
+
+
+def nss_wrapper():
+    """Find the nss_wrapper library, ``None`` if it is not installed."""
+    from ctypes.util import find_library
+    return os.environ.get('NSS_WRAPPER_LIB') or find_library('nss_wrapper')
+
+
+def _keys(prefix, size, offset=0):
+    """Random lookup keys, a tenth of which do not exist."""
+    rng = random.Random(size)
+    keys = []
+    for i in range(LOOKUPS):
+        if i % 10:
+            keys.append('%s%d' % (prefix, rng.randrange(size) + offset))
+        else:
+            keys.append('%s%d' % (prefix, size + offset + i))
+    return keys
+
+
+def latency(lookup, keys):
+    """Time `lookup` for every key, returns median and p99 in us."""
+    times = []
+    for key in keys:
+        start = timer()
+        lookup(key)
+        times.append(timer() - start)
+    times.sort()
+    return {
+        'median_us': times[len(times) // 2] * 1e6,
+        'p99_us': times[int(len(times) * 0.99)] * 1e6,
+    }
+
+
+def enumeration(function):
+    """Time and trace `function`, returns throughput and peak memory."""
+    best, count = None, 0
+    for _ in range(REPEAT):
+        start = timer()
+        count = len(function())
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+
+    return {
+        'records': count,
+        'seconds': best,
+        'records_per_second': count / best if best else None,
+        'peak_bytes': peak,
+    }
+
+
+def cases(backend, root, size):
+    """Yield ``(function, kind, callable, keys)`` for `backend`."""
+    import getent
+    from getent import columnar, files, store
+
+    users = _keys('user', size)
+    uids = [str(10000 + int(key[4:])) for key in users]
+    groups = _keys('group', size)
+    services = _keys('service', size)
+    hosts = _keys('host', size)
+
+    if backend == 'nss':
+        api = getent
+    elif backend == 'files':
+        api = files.Files(root)
+    else:
+        path = os.path.join(root, 'snapshot.db')
+        yield ('store.write', 'enumeration',
+               lambda: [store.write(path, source=files.Files(root))], None)
+        api = store.Store(path)
+
+    def cold(name):
+        # Files keeps what it parsed, enumerations start from scratch
+        if backend == 'files':
+            return lambda: getattr(files.Files(root), name)()
+        return getattr(api, name)
+
+    yield 'passwd', 'enumeration', cold('passwd'), None
+    yield 'passwd(name)', 'latency', api.passwd, users
+    yield 'passwd(uid)', 'latency', api.passwd, uids
+    yield 'group', 'enumeration', cold('group'), None
+    yield 'group(name)', 'latency', api.group, groups
+    yield 'host', 'enumeration', cold('host'), None
+    yield 'host(name)', 'latency', api.host, hosts
+    if backend != 'nss':
+        yield 'service', 'enumeration', cold('service'), None
+        yield 'service(name)', 'latency', api.service, services
+
+    yield ('Snapshot', 'enumeration',
+           lambda: getent.Snapshot(source=api, check=None).users(), None)
+    yield ('columnar.Table(passwd)', 'enumeration',
+           lambda: columnar.Table(getent.Passwd, cold('passwd')()), None)
+
+    if backend == 'nss':
+        yield ('passwd(columnar=True)', 'enumeration',
+               lambda: getent.passwd(columnar=True), None)
+        yield ('passwd_many', 'enumeration',
+               lambda: getent.passwd_many(users), None)
+        yield ('group_many', 'enumeration',
+               lambda: getent.group_many(groups), None)
+        yield ('host_many', 'enumeration',
+               lambda: getent.host_many(hosts), None)
+        yield 'groups_for_user', 'latency', getent.groups_for_user, users
+        yield ('groups_for_users', 'enumeration',
+               lambda: getent.groups_for_users(users), None)
+
+
+def worker(backend, root, size):
+    """Run all cases of `backend` in this process, print JSON results."""
+    results = []
+    for function, kind, call, keys in cases(backend, root, size):
+        if kind == 'latency':
+            metrics = latency(call, keys)
+        else:
+            metrics = enumeration(call)
+        metrics.update(backend=backend, size=size, function=function,
+                       kind=kind)
+        results.append(metrics)
+    json.dump(results, sys.stdout)
+
+
+def run(backend, root, size):
+    """Run the cases of `backend` in a new interpreter."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    if backend == 'nss':
+        library = nss_wrapper()
+        if not library:
+            return [{'backend': backend, 'size': size,
+                     'skipped': 'nss_wrapper is not installed'}]
+        etc = os.path.join(root, 'etc')
+        env.update(
+            LD_PRELOAD=library,
+            NSS_WRAPPER_PASSWD=os.path.join(etc, 'passwd'),
+            NSS_WRAPPER_GROUP=os.path.join(etc, 'group'),
+            NSS_WRAPPER_HOSTS=os.path.join(etc, 'hosts'),
+        )
+
+    output = subprocess.check_output([
+        sys.executable, __file__, '--worker', backend, root, str(size)],
+        env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def main():
+    """Run the benchmark and write the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help='comma separated database sizes')
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help='comma separated backends')
+    parser.add_argument('--output', help='write JSON here, not to stdout')
+    parser.add_argument('--worker', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        backend, root, size = args.worker
+        return worker(backend, root, int(size))
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        root = tempfile.mkdtemp(prefix='getent-bench')
+        try:
+            generate(root, size)
+            for backend in args.backends.split(','):
+                print('%-6s %8d' % (backend, size), file=sys.stderr)
+                results.extend(run(backend, root, size))
+        finally:
+            shutil.rmtree(root)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'nss_wrapper': nss_wrapper(),
+        'lookups': LOOKUPS,
+        'repeat': REPEAT,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,26 +2,29 @@
 
 # pylint: disable=too-few-public-methods
 
+import os
 import socket
-import struct
 import sys
-from ctypes import POINTER, cast, create_string_buffer, pointer, byref as _byref
-from datetime import datetime
+import threading
+from ctypes import POINTER, c_int, create_string_buffer, pointer, string_at
+from ctypes import byref as _byref
 
+from getent import cache as _cache
+from getent import deadlines as _deadlines
+from getent import metrics as _metrics
 from getent import headers
+from getent.deadlines import Timeout, deadline
 from getent.constants import (
     AF_INET,
     AF_INET6,
     IN6ADDRSZ,
     INADDRSZ,
     c_char_p,
+    ctypes_c_char_p,
     gid_t,
     uid_t
 )
 from getent.libc import (
-    getspnam,
-    getpwnam,
-    getpwuid,
     endaliasent,
     endgrent,
     endnetgrent,
@@ -34,23 +37,17 @@ from getent.libc import (
     endspent,
     getaliasent,
     getgrent,
+    getgrouplist,
     getnetgrent,
-    getgrgid,
-    getgrnam,
-    getrpcbyname,
-    getrpcbynumber,
-    gethostbyaddr,
-    gethostbyname2,
     gethostent,
     getnetent,
-    getprotobyname,
-    getprotobynumber,
     getprotoent,
     getpwent,
     getrpcent,
     getservent,
     getspent,
     inet_pton,
+    innetgr as _innetgr,
     setaliasent,
     setgrent,
     setnetgrent,
@@ -61,16 +58,38 @@ from getent.libc import (
     setrpcent,
     setservent,
     setspent,
+)
+from getent import reentrant as _reentrant
+from getent.reentrant import (
+    getgrgid,
+    getgrnam,
+    gethostbyaddr,
+    gethostbyname2,
     getnetbyname,
+    getprotobyname,
+    getprotobynumber,
+    getpwnam,
+    getpwuid,
+    getrpcbyname,
+    getrpcbynumber,
     getservbyname,
-    getservbyport
+    getservbyport,
+    getspnam,
 )
 
 __all__ = (
     'alias', 'group', 'host', 'network', 'passwd', 'proto', 'rpc', 'service',
-    'shadow', 'netgroup'
+    'shadow', 'netgroup', 'innetgr', 'group_many', 'host_many',
+    'passwd_many', 'groups_for_user', 'groups_for_users', 'NetgroupIndex',
+    'ServiceIndex', 'ShadowAudit', 'Snapshot', 'Timeout', 'deadline'
 )
 
+#: Number of threads used by the ``*_many`` batch lookups
+BATCH_WORKERS = 8
+
+#: Initial number of groups ``getgrouplist`` is asked for
+GROUPLIST_SIZE = 64
+
 if sys.version_info[0] < 3:
     def convert23(value):
         """Python 2/3 compatibility function for emitting encoded strings."""
@@ -82,69 +101,274 @@ else:
         return value.decode('utf-8') if isinstance(value, bytes) else value
 
 
-class StructMap(object):
+_set = object.__setattr__
 
-    """Base class for mapped C structs."""
+# Lock per set*ent/get*ent/end*ent cursor, by the name of set*ent
+_cursors = {}
+# Cursors a thread had open when the process forked, in the child
+_inherited = set()
 
-    def __init__(self, p):
-        """Generic struct constructor.
 
-        Will also define getter and setter attributes on the instance for all
-        struct members.
-        """
-        if(hasattr(p, "contents")):
-            self.p = p.contents
+def _after_fork():
+    """Forget the cursor locks, the threads that held them did not fork."""
+    _inherited.update(name for name, lock in list(_cursors.items())
+                      if lock.locked())
+    _cursors.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _strings(array):
+    """Convert a ``NULL`` terminated ``char **`` array to a tuple."""
+    res = []
+    i = 0
+    while array[i]:
+        res.append(convert23(array[i]))
+        i += 1
+    return tuple(res)
+
+
+def _compile(struct, exclude, convert, computed):
+    """Compile the constructor that copies `struct` into a record.
+
+    Returns the names of the record's fields, the generated ``__init__``,
+    which copies every field with a single attribute access instead of
+    reflecting on the struct for every record, and a generated ``_make``.
+    """
+    fields = []
+    namespace = {
+        'convert23': convert23,
+        '_new': object.__new__,
+        '_set': _set,
+        '_strings': _strings,
+    }
+    lines = [
+        'def __init__(self, p):',
+        '    if hasattr(p, "contents"):',
+        '        p = p.contents',
+    ]
+    for name, ctype in struct._fields_:
+        if name in exclude:
+            continue
+
+        fields.append(name)
+        if name in convert:
+            namespace['_convert_' + name] = convert[name]
+            value = '_convert_%s(p.%s)' % (name, name)
+        elif ctype is ctypes_c_char_p:
+            value = 'convert23(p.%s)' % (name,)
+        elif ctype is POINTER(ctypes_c_char_p):
+            value = '_strings(p.%s)' % (name,)
         else:
-            self.p = p
+            value = 'p.%s' % (name,)
+        lines.append('    _set(self, %r, %s)' % (name, value))
+
+    for name, func in sorted(computed.items()):
+        fields.append(name)
+        namespace['_compute_' + name] = func
+        lines.append('    _set(self, %r, _compute_%s(p))' % (name, name))
+
+    # Build records from plain values, in field order
+    lines.extend([
+        'def _make(cls, values):',
+        '    %s, = values' % (', '.join(fields),),
+        '    self = _new(cls)',
+    ])
+    lines.extend('    _set(self, %r, %s)' % (name, name) for name in fields)
+    lines.append('    return self')
+
+    exec('\n'.join(lines), namespace)  # pylint: disable=exec-used
+    return tuple(fields), namespace['__init__'], namespace['_make']
+
+
+def _restore(cls, values):
+    """Unpickle a record."""
+    return cls._make(values)
+
+
+class StructMapType(type):
+
+    """Metaclass that precompiles record classes.
+
+    Record classes that define ``_struct`` get their ``__slots__``, a fixed
+    ``_fields`` tuple and their constructor generated from the struct's
+    ``_fields_``, once, when the class is defined. Struct fields listed in
+    ``_exclude`` are not copied, fields in the ``_convert`` mapping are
+    passed through their converter, and ``_computed`` maps names of extra
+    fields to functions that compute them from the struct.
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        struct = attrs.get('_struct')
+        if struct is not None:
+            fields, init, make = _compile(
+                struct,
+                attrs.get('_exclude', ()),
+                attrs.get('_convert', {}),
+                attrs.get('_computed', {}),
+            )
+            attrs['_fields'] = attrs['__slots__'] = fields
+            attrs.setdefault('__init__', init)
+            attrs.setdefault('_make', classmethod(make))
+        return super(StructMapType, mcs).__new__(mcs, name, bases, attrs)
+
+
+class StructMap(StructMapType('StructMapBase', (object,), {'__slots__': ()})):
+
+    """Base class for mapped C structs.
+
+    Records copy all data out of the struct when they are created, and do
+    not keep any reference to it. They are immutable, hashable and can be
+    pickled.
+    """
+
+    __slots__ = ()
 
-        for attr in dir(self.p):
+    #: Names of the record's fields, in struct order
+    _fields = ()
 
-            if attr.startswith('_'):
-                continue
+    @classmethod
+    def _make(cls, values):
+        """Make a record from a sequence of values, in `_fields` order."""
+        values = tuple(values)
+        if len(values) != len(cls._fields):
+            raise ValueError('%s expects %d values, got %d' % (
+                cls.__name__, len(cls._fields), len(values)))
 
-            elif not hasattr(self, attr):
-                value = getattr(self.p, attr)
-                setattr(self, attr, convert23(value))
+        record = cls.__new__(cls)
+        for name, value in zip(cls._fields, values):
+            _set(record, name, value)
+        return record
+
+    def _values(self):
+        return tuple(getattr(self, attr) for attr in self._fields)
 
     def __iter__(self):
         """Iterate over the mapped struct members.
 
         Yields `(key, value)` pairs.
         """
-        for attr in dir(self.p):
-            if attr.startswith('_'):
-                continue
+        for attr in self._fields:
+            yield (attr, getattr(self, attr))
 
-            else:
-                yield (attr, getattr(self, attr))
+    def __getitem__(self, attr):
+        if attr not in self._fields:
+            raise KeyError(attr)
+        return getattr(self, attr)
 
-    def _map(self, attr):
-        i = 0
-        #obj = getattr(self.p.contents, attr)
-        obj = getattr(self.p, attr)
+    def __setattr__(self, attr, value):
+        raise AttributeError('%s records are read-only' % (
+            self.__class__.__name__,))
 
-        while obj[i]:
-            yield convert23(obj[i])
-            i += 1
+    def __delattr__(self, attr):
+        raise AttributeError('%s records are read-only' % (
+            self.__class__.__name__,))
 
-    def __getitem__(self, attr):
-        return self.p[attr]
+    def __eq__(self, other):
+        return (self.__class__ is other.__class__ and
+                self._values() == other._values())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.__class__.__name__, self._values()))
+
+    def __reduce__(self):
+        return (_restore, (self.__class__, self._values()))
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % item for item in self))
 
 
 def _resolve(addrtype, addr):
     if addrtype == AF_INET:
-        p = cast(addr, POINTER(headers.InAddrStruct))
-        # Here we pack to little-endian to reverse back to
-        # network byte order
-        packed = struct.pack('<I', p.contents.s_addr)
-        return socket.inet_ntop(addrtype, packed)
+        return socket.inet_ntop(addrtype, string_at(addr, INADDRSZ))
     elif addrtype == AF_INET6:
-        p = cast(addr, POINTER(headers.InAddr6Struct))
-        packed = ''.join([
-            struct.pack('<L', bit)
-            for bit in p.contents.in6_u.u6_addr32
-        ])
-        return socket.inet_ntop(addrtype, packed)
+        return socket.inet_ntop(addrtype, string_at(addr, IN6ADDRSZ))
+
+
+def _addresses(ent):
+    """Format the ``NULL`` terminated address list of a ``hostent``."""
+    res = []
+    i = 0
+    while ent.addr_list[i]:
+        res.append(_resolve(ent.addrtype, ent.addr_list[i]))
+        i += 1
+    return tuple(res)
+
+
+def _enumerate(setent, getent, endent, cls):
+    """Yield records from a ``set*ent``/``get*ent``/``end*ent`` cursor.
+
+    The cursor is closed with ``end*ent`` when the enumeration is exhausted,
+    but also when the consumer stops iterating early or raises.
+
+    The cursor is global to the process, so it is locked from ``set*ent``
+    until ``end*ent``. An enumeration that was left behind by a lookup that
+    missed its deadline finishes before the next one starts. A process
+    forked while a cursor is open opens a cursor of its own. Streamed
+    enumerations may be consumed by several threads in turn, so any thread
+    may release the lock; enumerating a database while iterating over a
+    stream of the same database waits forever.
+    """
+    with _cursors.setdefault(setent.name, threading.Lock()):
+        if setent.name in _inherited:
+            # The open cursor of the parent shares its file offsets, close
+            # it before opening one of our own
+            _inherited.discard(setent.name)
+            endent()
+        setent()
+        try:
+            while True:
+                ent = getent()
+                if not ent:
+                    break
+                yield cls(ent)
+        finally:
+            endent()
+
+
+def _search_key(search):
+    """Normalise a search key to an ``int`` id or a name."""
+    if isinstance(search, int):
+        return search
+    search = str(search)
+    return int(search) if search.isdigit() else search
+
+
+def _many(lookup, keys, functions, workers=None, normalise=_search_key):
+    """Run `lookup` once for every distinct (normalised) key in `keys`.
+
+    The lookups run on a pool of `workers` threads if all of the libc
+    `functions` involved are reentrant.
+    """
+    # Imported here, as concurrent.futures is slow to import
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:  # Python 2 without the futures backport
+        ThreadPoolExecutor = None
+
+    keys = dict((key, normalise(key)) for key in keys)
+    unique = list(set(keys.values()))
+    if workers is None:
+        workers = BATCH_WORKERS
+
+    concurrent = (
+        ThreadPoolExecutor is not None and
+        workers > 1 and len(unique) > 1 and
+        all(_reentrant.available(name) for name in functions)
+    )
+    if concurrent:
+        with ThreadPoolExecutor(min(workers, len(unique))) as pool:
+            found = dict(zip(unique, pool.map(lookup, unique)))
+    else:
+        found = dict((key, lookup(key)) for key in unique)
+
+    return dict((key, found[norm]) for key, norm in keys.items())
 
 
 # pep257: disable=D102
@@ -167,13 +391,46 @@ class Host(StructMap):
 
     """
 
-    addrtype = socket.AF_INET
+    _struct = headers.HostStruct
+    _exclude = ('addr_list_len', 'addr_list')
+    _computed = {'addresses': _addresses}
 
-    def __init__(self, p):
-        super(Host, self).__init__(p)
-        self.aliases = list(self._map('aliases'))
-        self.addresses = [_resolve(self.addrtype, addr)
-                          for addr in self._map('addr_list')]
+
+class HostAddresses(StructMap):
+
+    """Addresses of all families of a host, see :func:`host`.
+
+    .. py:attribute:: name
+
+       Canonical name of the host.
+
+    .. py:attribute:: packed
+
+       Tuple of ``(family, packed address)`` pairs, in resolver order.
+
+    The :attr:`addresses`, :attr:`ipv4` and :attr:`ipv6` properties format
+    the packed addresses when they are accessed.
+    """
+
+    __slots__ = _fields = ('name', 'packed')
+
+    @property
+    def addresses(self):
+        """Tuple of all addresses."""
+        return tuple(socket.inet_ntop(family, packed)
+                     for family, packed in self.packed)
+
+    @property
+    def ipv4(self):
+        """Tuple of the IPv4 addresses."""
+        return tuple(socket.inet_ntop(family, packed)
+                     for family, packed in self.packed if family == AF_INET)
+
+    @property
+    def ipv6(self):
+        """Tuple of the IPv6 addresses."""
+        return tuple(socket.inet_ntop(family, packed)
+                     for family, packed in self.packed if family == AF_INET6)
 
 
 class Proto(StructMap):
@@ -193,9 +450,7 @@ class Proto(StructMap):
        The protocol number.
     """
 
-    def __init__(self, p):
-        super(Proto, self).__init__(p)
-        self.aliases = list(self._map('aliases'))
+    _struct = headers.ProtoStruct
 
 
 class RPC(StructMap):
@@ -215,9 +470,7 @@ class RPC(StructMap):
        The RPC program number for this service.
     """
 
-    def __init__(self, p):
-        super(RPC, self).__init__(p)
-        self.aliases = list(self._map('aliases'))
+    _struct = headers.RPCStruct
 
 
 class Service(StructMap):
@@ -241,9 +494,8 @@ class Service(StructMap):
        The name of the protocol to use with this service.
     """
 
-    def __init__(self, p):
-        super(Service, self).__init__(p)
-        self.aliases = list(self._map('aliases'))
+    _struct = headers.ServiceStruct
+    _convert = {'port': socket.ntohs}
 
 
 class Network(StructMap):
@@ -267,9 +519,7 @@ class Network(StructMap):
        The network number.
     """
 
-    def __init__(self, p):
-        super(Network, self).__init__(p)
-        self.aliases = list(self._map('aliases'))
+    _struct = headers.NetworkStruct
 
 
 class Alias(StructMap):
@@ -289,34 +539,29 @@ class Alias(StructMap):
        Local flag.
     """
 
-    def __init__(self, p):
-        super(Alias, self).__init__(p)
-        self.members = list(self._map('members'))
+    _struct = headers.AliasStruct
+    _exclude = ('members_len',)
 
 
 class Netgroup(StructMap):
 
-    """Struct ``netgroup`` from ``<netgroup.h>``.
-
-    .. py:attribute:: netgroup
-
-       The name of the netgroup.
+    """Netgroup from ``<netdb.h>``.
 
     .. py:attribute:: name
 
-       The user allowed for the netgroup. * is a wildcard.
-
-    .. py:attribute:: host
-
-       The host allowed for the netgroup. * is a wildcard.
+       The name of the netgroup.
 
-    .. py:attribute:: domain
+    .. py:attribute:: members
 
-       The domain allowed for the netgroup. * is a wildcard.
+       Tuple of ``(host, user, domain)`` triples allowed by the netgroup.
+       ``None`` is a wildcard.
     """
 
+    __slots__ = _fields = ('name', 'members')
+
     def __init__(self, p):
-        super(Netgroup, self).__init__(p)
+        _set(self, 'name', p['name'] if p else None)
+        _set(self, 'members', tuple(p['members']) if p else ())
 
 
 class Group(StructMap):
@@ -340,9 +585,7 @@ class Group(StructMap):
        List of group members.
     """
 
-    def __init__(self, p):
-        super(Group, self).__init__(p)
-        self.members = list(self._map('members'))
+    _struct = headers.GroupStruct
 
 
 class Passwd(StructMap):
@@ -378,7 +621,7 @@ class Passwd(StructMap):
        Shell program.
     """
 
-    pass
+    _struct = headers.PasswdStruct
 
 
 class Shadow(StructMap):
@@ -395,11 +638,13 @@ class Shadow(StructMap):
 
     .. py:attribute:: change
 
-       Date of last change.
+       Day of the last change, in days since 1970-01-01. ``0`` means the
+       password must be changed at the next login, ``-1`` that aging is
+       disabled.
 
     .. py:attribute:: expire
 
-       Date when account expires.
+       Day the account expires, in days since 1970-01-01, or ``-1``.
 
     .. py:attribute:: min
 
@@ -418,13 +663,12 @@ class Shadow(StructMap):
        Number of days after password expires until account is disabled.
     """
 
-    def __init__(self, p):
-        super(Shadow, self).__init__(p)
-        self.change = datetime.fromtimestamp(p.contents.change)
-        self.expire = datetime.fromtimestamp(p.contents.expire)
+    _struct = headers.ShadowStruct
 
 
-def alias(search=None):
+@_metrics.instrument
+@_deadlines.limited
+def alias(search=None, stream=False):
     """Perform a (mail) alias lookup.
 
     To iterate over all alias entries::
@@ -432,28 +676,28 @@ def alias(search=None):
         >>> for item in alias():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in alias(stream=True):
+        ...
+
     To lookup a single alias::
 
         >>> mail = alias('postmaster')
         >>> print mail.members
         root
     """
-    if not callable(setaliasent):
+    if not setaliasent:
         raise NotImplementedError
 
     if search is None:
-        setaliasent()
-        p = True
-        r = []
-        while p:
-            p = getaliasent()
-            if p:
-                r.append(Alias(p))
-        endaliasent()
-        return r
-
-
-def host(search=None):
+        res = _enumerate(setaliasent, getaliasent, endaliasent, Alias)
+        return res if stream else list(res)
+
+
+@_metrics.instrument
+@_deadlines.limited
+def host(search=None, stream=False, dual_stack=False):
     """Perform a host lookup.
 
     To iterate over all host entries::
@@ -461,6 +705,11 @@ def host(search=None):
         >>> for item in host():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in host(stream=True):
+        ...
+
     To lookup a single host by name::
 
         >>> import socket
@@ -468,20 +717,28 @@ def host(search=None):
         >>> server.addrtype in [socket.AF_INET, socket.AF_INET6]
         True
 
+    A host name is first looked up for IPv6 addresses, and only if it has
+    none for IPv4 addresses. To get the addresses of both families in one
+    ``getaddrinfo`` pass, as a :class:`HostAddresses`::
+
+        >>> server = host('localhost', dual_stack=True)
+        >>> server.addresses
+        ('::1', '127.0.0.1')
+
+    Only the families the host has an address of itself are asked for
+    (``AI_ADDRCONFIG``), so on a host without IPv6 addresses this is
+    ``('127.0.0.1',)``.
     """
-    if not callable(sethostent):
+    if dual_stack and search is not None:
+        from getent.resolver import lookup
+        return lookup(str(search))
+
+    if not sethostent:
         raise NotImplementedError
 
     if search is None:
-        sethostent()
-        p = True
-        r = []
-        while p:
-            p = gethostent()
-            if p:
-                r.append(Host(p))
-        endhostent()
-        return r
+        res = _enumerate(sethostent, gethostent, endhostent, Host)
+        return res if stream else list(res)
 
     else:
         def lookup():
@@ -512,7 +769,27 @@ def host(search=None):
             return Host(host)
 
 
-def proto(search=None):
+@_metrics.instrument
+@_deadlines.limited
+def host_many(keys, workers=None):
+    """Perform host lookups for many names and/or addresses at once.
+
+    Duplicate keys are looked up once, and the lookups run concurrently if
+    libc offers reentrant functions for them. Returns a mapping of each key
+    to its record, or ``None`` if it was not found::
+
+        >>> res = host_many(['localhost', '127.0.0.1'])
+        >>> print res['127.0.0.1'].name
+        localhost
+
+    """
+    return _many(host, keys, ('gethostbyaddr', 'gethostbyname2'), workers,
+                 normalise=str)
+
+
+@_metrics.instrument
+@_deadlines.limited
+def proto(search=None, stream=False):
     """Perform a protocol lookup.
 
     To lookup all protocols::
@@ -520,30 +797,28 @@ def proto(search=None):
         >>> for item in proto():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in proto(stream=True):
+        ...
+
     To lookup a single protocol number::
 
         >>> tcp = proto('tcp')
         >>> print tcp.proto
         6
     """
-    if not callable(setprotoent):
+    if not setprotoent:
         raise NotImplementedError
 
     if search is None:
-        setprotoent()
-        prt = True
-        res = []
-        while prt:
-            prt = getprotoent()
-            if prt:
-                res.append(Proto(prt))
-        endprotoent()
-        return res
+        res = _enumerate(setprotoent, getprotoent, endprotoent, Proto)
+        return res if stream else list(res)
 
     else:
         search = str(search)
         if search.isdigit():
-            prt = getprotobynumber(uid_t(int(search)))
+            prt = getprotobynumber(int(search))
         else:
             prt = getprotobyname(c_char_p(search))
 
@@ -551,7 +826,9 @@ def proto(search=None):
             return Proto(prt)
 
 
-def rpc(search=None):
+@_metrics.instrument
+@_deadlines.limited
+def rpc(search=None, stream=False):
     """Perform a remote procedure call lookup.
 
     To lookup all rpc services::
@@ -559,6 +836,11 @@ def rpc(search=None):
         >>> for item in rpc():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in rpc(stream=True):
+        ...
+
     To lookup one rpc service by name::
 
         >>> nfs = rpc('nfs')
@@ -568,24 +850,17 @@ def rpc(search=None):
         ['portmap', 'sunrpc']
 
     """
-    if not callable(setrpcent):
+    if not setrpcent:
         raise NotImplementedError
 
     if search is None:
-        setrpcent()
-        ent = True
-        res = []
-        while ent:
-            ent = getrpcent()
-            if ent:
-                res.append(RPC(ent))
-        endrpcent()
-        return res
+        res = _enumerate(setrpcent, getrpcent, endrpcent, RPC)
+        return res if stream else list(res)
 
     else:
         search = str(search)
         if search.isdigit():
-            ent = getrpcbynumber(uid_t(int(search)))
+            ent = getrpcbynumber(int(search))
         else:
             ent = getrpcbyname(c_char_p(search))
 
@@ -593,7 +868,9 @@ def rpc(search=None):
             return RPC(ent)
 
 
-def service(search=None, protocol=None):
+@_metrics.instrument
+@_deadlines.limited
+def service(search=None, protocol=None, stream=False):
     """Perform a service lookup.
 
     To lookup all services::
@@ -601,11 +878,16 @@ def service(search=None, protocol=None):
         >>> for item in service():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in service(stream=True):
+        ...
+
     To lookup one service by port number::
 
-        >>> http = service(0, 'tcp')
-        >>> print http.port
-        80
+        >>> http = service(80, 'tcp')
+        >>> print http.name
+        http
 
     Or by service name::
 
@@ -619,34 +901,34 @@ def service(search=None, protocol=None):
         >>> print snmp.port
         161
 
+    Without a protocol, the first service of any protocol is returned. For
+    many lookups, use a :class:`ServiceIndex`.
+
     """
     if search is None:
-        setservent()
-        srv = True
-        res = []
-        while srv:
-            srv = getservent()
-            if srv:
-                res.append(Service(srv))
-        endservent()
-        return res
+        res = _enumerate(setservent, getservent, endservent, Service)
+        return res if stream else list(res)
 
     else:
         search = str(search)
         if not protocol and '/' in search:
             protocol, search = search.split('/')
-        if proto not in ['tcp', 'udp']:
+        if protocol is not None and protocol not in ['tcp', 'udp']:
             raise ValueError('Unsupported protocol "%s"' % (str(protocol),))
+        if protocol is not None:
+            protocol = c_char_p(protocol)
         if search.isdigit():
-            srv = getservbyport(uid_t(int(search)), c_char_p(protocol))
+            srv = getservbyport(socket.htons(int(search)), protocol)
         else:
-            srv = getservbyname(c_char_p(search), c_char_p(protocol))
+            srv = getservbyname(c_char_p(search), protocol)
 
         if bool(srv):
             return Service(srv)
 
 
-def network(search=None):
+@_metrics.instrument
+@_deadlines.limited
+def network(search=None, stream=False):
     """Perform a network lookup.
 
     To lookup all services::
@@ -654,21 +936,19 @@ def network(search=None):
         >>> for item in network():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in network(stream=True):
+        ...
+
     To lookup one network by name::
 
         >>> net = network('link-local')
 
     """
     if search is None:
-        setnetent()
-        net = True
-        res = []
-        while net:
-            net = getnetent()
-            if net:
-                res.append(Network(net))
-        endnetent()
-        return res
+        res = _enumerate(setnetent, getnetent, endnetent, Network)
+        return res if stream else list(res)
 
     else:
         net = getnetbyname(c_char_p(search))
@@ -676,40 +956,77 @@ def network(search=None):
             return Network(net)
 
 
-def netgroup(netgroup,host=None,user=None,domain=None):
+def _netgroup_key(value):
+    return None if value is None else c_char_p(str(value))
+
+
+@_metrics.instrument
+@_deadlines.limited
+def netgroup(netgroup, host=None, user=None, domain=None):
     """Perform a netgroup lookup.
 
-    Enumeration is not supported on netgroup, so either one or three keys must be provided.
+    Enumeration is not supported on netgroup, so a netgroup name must be
+    provided.
 
     To lookup one group by netgroup name::
 
-        >>> ng = netgroup(netgroupname)
+        >>> ng = netgroup('trusted')
         >>> print ng.name
-        'netgroupname'
+        trusted
+        >>> ng.members
+        (('db1', None, None), (None, 'alice', 'example.org'))
+
+    Members of nested netgroups are included. If one of `host`, `user` or
+    `domain` is given, only test for membership instead, see
+    :func:`innetgr`::
+
+        >>> netgroup('trusted', host='db1')
+        True
 
     """
-    host,user,domain = c_char_p(None),c_char_p(None),c_char_p(None)
+    if host is not None or user is not None or domain is not None:
+        return innetgr(netgroup, host, user, domain)
 
     # If netgroup is None, fatal error
     if netgroup is None:
         return Netgroup(False)
-        #return None
 
-    else:
-        # True or False
-        netgrp = setnetgrent(netgroup)
-        members = []
-        while netgrp:
-            # getnetgrent need pointers to be written
-            netgrp = getnetgrent(_byref(host), _byref(user), _byref(domain))
-            if netgrp:
-                #res.append(Netgroup(netgrp))
-                members.append({ 'host':host.value,'user':user.value,'domain':domain.value })
+    host, user, domain = (ctypes_c_char_p(), ctypes_c_char_p(),
+                          ctypes_c_char_p())
+    members = []
+    try:
+        if setnetgrent(c_char_p(str(netgroup))):
+            # getnetgrent needs pointers to be written, NULL is a wildcard
+            while getnetgrent(_byref(host), _byref(user), _byref(domain)):
+                members.append((convert23(host.value), convert23(user.value),
+                                convert23(domain.value)))
+    finally:
         endnetgrent()
-        return Netgroup({'name':netgroup,'members':members})
+    return Netgroup({'name': netgroup, 'members': members})
+
+
+@_metrics.instrument
+@_deadlines.limited
+def innetgr(netgroup, host=None, user=None, domain=None):
+    """Test if a host, user and/or domain is a member of a netgroup.
+
+    Keys that are ``None`` match any member. The C library looks at the
+    members itself, including those of nested netgroups, so this is much
+    cheaper than scanning the members returned by :func:`netgroup`::
+
+        >>> innetgr('trusted', host='db1', user='alice')
+        True
+
+    See :class:`NetgroupIndex` to answer many of these
+    tests from memory.
+    """
+    return _innetgr(c_char_p(str(netgroup)), _netgroup_key(host),
+                    _netgroup_key(user), _netgroup_key(domain)) == 1
 
 
-def group(search=None):
+@_metrics.instrument
+@_deadlines.limited
+def group(search=None, stream=False, columnar=False):
     """Perform a group lookup.
 
     To lookup all groups::
@@ -717,6 +1034,18 @@ def group(search=None):
         >>> for item in group():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in group(stream=True):
+        ...
+
+    To keep all entries in a compact :class:`getent.columnar.Table`, which
+    builds records only when they are accessed::
+
+        >>> groups = group(columnar=True)
+        >>> print groups.column('gid')
+        array('I', [0, ...])
+
     To lookup one group by group id (gid)::
 
         >>> root = group(0)
@@ -732,28 +1061,100 @@ def group(search=None):
     """
     # Iterate over all group entries
     if search is None:
-        setgrent()
-        grp = True
-        res = []
-        while grp:
-            grp = getgrent()
-            if grp:
-                res.append(Group(grp))
-        endgrent()
-        return res
+        res = _enumerate(setgrent, getgrent, endgrent, Group)
+        if columnar:
+            from getent.columnar import Table
+            return Table(Group, res)
+        return res if stream else list(res)
 
     else:
-        search = str(search)
-        if search.isdigit():
-            grp = getgrgid(gid_t(int(search)))
-        else:
-            grp = getgrnam(c_char_p(search))
+        return _group(_search_key(search))
+
+
+def _group(key):
+    """Lookup one group entry by normalised search `key`."""
+    cache = _cache.get('group')
+    if cache is not None:
+        res = cache.get(key)
+        if res is not _cache.MISSING:
+            return res
+
+    if isinstance(key, int):
+        grp = getgrgid(gid_t(key))
+    else:
+        grp = getgrnam(c_char_p(key))
+
+    res = Group(grp) if grp else None
+    if cache is not None:
+        cache.put(key, res, (res.name, res.gid) if res else ())
+    return res
+
+
+@_metrics.instrument
+@_deadlines.limited
+def group_many(keys, workers=None):
+    """Perform group lookups for many names and/or ids at once.
 
-        if bool(grp):
-            return Group(grp)
+    Duplicate keys are looked up once, and the lookups run concurrently if
+    libc offers reentrant functions for them. Returns a mapping of each key
+    to its record, or ``None`` if it was not found::
 
+        >>> res = group_many([0, 'root', 'nosuchentry'])
+        >>> print res[0].name, res['root'].name
+        root root
+        >>> print res['nosuchentry']
+        None
 
-def passwd(search=None):
+    """
+    return _many(_group, keys, ('getgrgid', 'getgrnam'), workers)
+
+
+@_metrics.instrument(sized=False)
+@_deadlines.limited
+def groups_for_user(name, gid=None):
+    """Get the ids of all groups user `name` is a member of.
+
+    This asks NSS for the user's groups directly with ``getgrouplist``,
+    instead of enumerating all groups. The primary group `gid` is included,
+    it defaults to the user's group from the passwd database. Returns
+    ``None`` if `gid` is not given and the user does not exist::
+
+        >>> groups_for_user('root')
+        [0]
+
+    """
+    if gid is None:
+        user = _passwd(str(name))
+        if user is None:
+            return None
+        gid = user.gid
+
+    size = GROUPLIST_SIZE
+    while True:
+        groups = (gid_t * size)()
+        count = c_int(size)
+        if getgrouplist(c_char_p(name), gid, groups, _byref(count)) >= 0:
+            return list(groups[:count.value])
+
+        # libc reports the number of groups it needs in count
+        size = max(count.value, size * 2)
+
+
+@_metrics.instrument
+@_deadlines.limited
+def groups_for_users(names, workers=None):
+    """Get the group ids for many users at once.
+
+    Returns a mapping of each user name to its group ids, or ``None``, as
+    :func:`groups_for_user` would.
+    """
+    return _many(groups_for_user, names, ('getgrouplist', 'getpwnam'),
+                 workers, normalise=str)
+
+
+@_metrics.instrument
+@_deadlines.limited
+def passwd(search=None, stream=False, columnar=False):
     """Perform a passwd lookup.
 
     To lookup all passwd entries::
@@ -761,6 +1162,18 @@ def passwd(search=None):
         >>> for item in passwd():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in passwd(stream=True):
+        ...
+
+    To keep all entries in a compact :class:`getent.columnar.Table`, which
+    builds records only when they are accessed::
+
+        >>> passwds = passwd(columnar=True)
+        >>> print passwds.column('uid')
+        array('I', [0, ...])
+
     To lookup one user by user id (uid)::
 
         >>> root = passwd(0)
@@ -774,33 +1187,62 @@ def passwd(search=None):
         0
 
     """
-    if not callable(setpwent):
+    if not setpwent:
         raise NotImplementedError
 
     # Iterate over all passwd entries
     if search is None:
-        setpwent()
-        pwd = True
-        res = []
-        while pwd:
-            pwd = getpwent()
-            if pwd:
-                res.append(Passwd(pwd))
-        endpwent()
-        return res
+        res = _enumerate(setpwent, getpwent, endpwent, Passwd)
+        if columnar:
+            from getent.columnar import Table
+            return Table(Passwd, res)
+        return res if stream else list(res)
 
     else:
-        search = str(search)
-        if search.isdigit():
-            pwd = getpwuid(uid_t(int(search)))
-        else:
-            pwd = getpwnam(c_char_p(search))
+        return _passwd(_search_key(search))
+
+
+def _passwd(key):
+    """Lookup one passwd entry by normalised search `key`."""
+    cache = _cache.get('passwd')
+    if cache is not None:
+        res = cache.get(key)
+        if res is not _cache.MISSING:
+            return res
+
+    if isinstance(key, int):
+        pwd = getpwuid(uid_t(key))
+    else:
+        pwd = getpwnam(c_char_p(key))
+
+    res = Passwd(pwd) if pwd else None
+    if cache is not None:
+        cache.put(key, res, (res.name, res.uid) if res else ())
+    return res
+
 
-        if bool(pwd):
-            return Passwd(pwd)
+@_metrics.instrument
+@_deadlines.limited
+def passwd_many(keys, workers=None):
+    """Perform passwd lookups for many names and/or ids at once.
 
+    Duplicate keys are looked up once, and the lookups run concurrently if
+    libc offers reentrant functions for them. Returns a mapping of each key
+    to its record, or ``None`` if it was not found::
 
-def shadow(search=None):
+        >>> res = passwd_many([0, 'root', 'nosuchentry'])
+        >>> print res[0].name, res['root'].name
+        root root
+        >>> print res['nosuchentry']
+        None
+
+    """
+    return _many(_passwd, keys, ('getpwuid', 'getpwnam'), workers)
+
+
+@_metrics.instrument
+@_deadlines.limited
+def shadow(search=None, stream=False):
     """Perform a shadow lookup.
 
     To lookup all shadow entries::
@@ -808,6 +1250,11 @@ def shadow(search=None):
         >>> for item in shadow():
         ...
 
+    To stream entries as libc returns them, without building a list::
+
+        >>> for item in shadow(stream=True):
+        ...
+
     To lookup one user by name::
 
         >>> root = shadow('root')
@@ -817,25 +1264,33 @@ def shadow(search=None):
     """
     # Iterate over all shadow entries
     if search is None:
-        if not callable(setspent):
+        if not setspent:
             raise NotImplementedError('Not available on %s' % (sys.platform,))
-        setspent()
-        spe = True
-        res = []
-        while spe:
-            spe = getspent()
-            if spe:
-                res.append(Shadow(spe))
-        endspent()
-        return res
+        res = _enumerate(setspent, getspent, endspent, Shadow)
+        return res if stream else list(res)
 
     else:
-        if not callable(getspnam):
+        if not getspnam:
             raise NotImplementedError
 
-        spe = getspnam(search)
-        if bool(spe):
-            return Shadow(spe)
+        cache = _cache.get('shadow')
+        if cache is not None:
+            res = cache.get(search)
+            if res is not _cache.MISSING:
+                return res
+
+        spe = getspnam(c_char_p(search))
+        res = Shadow(spe) if spe else None
+        if cache is not None:
+            cache.put(search, res)
+        return res
+
+
+# Imported last, the snapshot enumerates through the functions above
+from getent.audit import ShadowAudit  # noqa: E402
+from getent.netgroups import NetgroupIndex  # noqa: E402
+from getent.services import ServiceIndex  # noqa: E402
+from getent.snapshot import Snapshot  # noqa: E402
 
 
 if __name__ == '__main__':
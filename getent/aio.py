@@ -0,0 +1,149 @@
+"""Asyncio interface for the getent package.
+
+NSS lookups block, so the awaitable lookups in this module run the regular
+:mod:`getent` functions on a dedicated, bounded thread pool, and return the
+same record classes::
+
+    >>> import getent.aio
+    >>> root = await getent.aio.passwd('root')
+    >>> print(root.uid)
+    0
+
+Entire databases are enumerated with :func:`stream`, which fetches records in
+batches, and only fetches the next batch once the consumer asked for it::
+
+    >>> async for user in getent.aio.stream('passwd'):
+    ...     print(user.name)
+
+This module requires Python 3.7 or newer.
+"""
+
+import asyncio
+import functools
+import itertools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import getent
+
+__all__ = (
+    'alias',
+    'get_executor',
+    'group',
+    'group_many',
+    'host',
+    'host_many',
+    'innetgr',
+    'netgroup',
+    'network',
+    'passwd',
+    'passwd_many',
+    'proto',
+    'rpc',
+    'service',
+    'set_executor',
+    'shadow',
+    'stream',
+)
+
+#: Number of threads in the default executor
+MAX_WORKERS = 8
+
+#: Number of records fetched per batch by :func:`stream`
+BATCH_SIZE = 256
+
+#: Databases that can be enumerated with :func:`stream`
+DATABASES = ('alias', 'group', 'host', 'network', 'passwd', 'proto', 'rpc',
+             'service', 'shadow')
+
+_executor = None
+_locks = weakref.WeakKeyDictionary()
+
+
+def get_executor():
+    """Get the executor lookups run on, creating it on first use."""
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        _executor = ThreadPoolExecutor(MAX_WORKERS,
+                                       thread_name_prefix='getent')
+    return _executor
+
+
+def set_executor(executor):
+    """Run lookups on `executor` from now on.
+
+    The previous executor is not shut down.
+    """
+    global _executor  # pylint: disable=global-statement
+    _executor = executor
+
+
+async def _run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _awaitable(func):
+    """Wrap blocking lookup `func` in a coroutine function."""
+    @functools.wraps(func)
+    async def lookup(*args, **kwargs):
+        return await _run(func, *args, **kwargs)
+
+    lookup.__doc__ = 'Awaitable version of :func:`getent.%s`.' % (
+        func.__name__,)
+    return lookup
+
+
+alias = _awaitable(getent.alias)
+group = _awaitable(getent.group)
+group_many = _awaitable(getent.group_many)
+host = _awaitable(getent.host)
+host_many = _awaitable(getent.host_many)
+innetgr = _awaitable(getent.innetgr)
+netgroup = _awaitable(getent.netgroup)
+network = _awaitable(getent.network)
+passwd = _awaitable(getent.passwd)
+passwd_many = _awaitable(getent.passwd_many)
+proto = _awaitable(getent.proto)
+rpc = _awaitable(getent.rpc)
+service = _awaitable(getent.service)
+shadow = _awaitable(getent.shadow)
+
+
+async def stream(database, batch_size=BATCH_SIZE):
+    """Enumerate all entries of `database`, for example ``'passwd'``.
+
+    Records are fetched `batch_size` at a time. The ``set*ent``/``get*ent``
+    cursor of a database is global to the process, so enumerations of the
+    same database from this event loop are serialised. The cursor is closed
+    when the enumeration ends, also if the consumer stops early.
+    """
+    if database not in DATABASES:
+        raise ValueError('Can not enumerate "%s"' % (database,))
+
+    locks = _locks.setdefault(asyncio.get_running_loop(), {})
+    async with locks.setdefault(database, asyncio.Lock()):
+        records = getattr(getent, database)(stream=True)
+        # If the consumer is cancelled while a batch is fetched, the fetch
+        # goes on in its thread, and closing has to wait for it
+        busy = threading.Lock()
+
+        def fetch():
+            with busy:
+                return list(itertools.islice(records, batch_size))
+
+        def close():
+            with busy:
+                records.close()
+
+        try:
+            while True:
+                batch = await _run(fetch)
+                if not batch:
+                    break
+                for record in batch:
+                    yield record
+        finally:
+            await _run(close)
@@ -0,0 +1,37 @@
+"""Helpers for the functions that take or return many values at once.
+
+NumPy is optional, and is only imported once it is needed, so importing
+:mod:`getent` does not pay for it.
+"""
+
+import sys
+from operator import itemgetter
+
+__all__ = ('is_ndarray', 'numpy', 'take')
+
+_numpy = []
+
+
+def numpy():
+    """Get the :mod:`numpy` module, or ``None`` if it is not installed."""
+    if not _numpy:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        _numpy.append(module)
+    return _numpy[0]
+
+
+def is_ndarray(value):
+    """Test if `value` is a NumPy array, without importing NumPy."""
+    module = sys.modules.get('numpy')
+    return module is not None and isinstance(value, module.ndarray)
+
+
+def take(table, keys):
+    """Get ``table[key]`` for all `keys`, as a list."""
+    keys = list(keys)
+    if len(keys) == 1:
+        return [table[keys[0]]]
+    return list(itemgetter(*keys)(table)) if keys else []
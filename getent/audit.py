@@ -0,0 +1,176 @@
+"""Password aging audit of the shadow database.
+
+A :class:`ShadowAudit` enumerates the shadow database once and keeps the
+aging data of all accounts in columns, one array per property, with the
+account names in :attr:`ShadowAudit.names`::
+
+    >>> audit = getent.ShadowAudit()
+    >>> audit.expiring(14)
+    ['alice']
+    >>> audit.unchanged_for(365)
+    ['root', 'daemon']
+
+All columns are counted in days, relative to `today`. Values that do not
+apply, such as the expiry of a password without a maximum age, are
+:data:`NEVER`. Columns are NumPy arrays if NumPy is installed, and
+:class:`array.array` otherwise; filters run over whole columns with NumPy.
+"""
+
+import array
+import time
+
+from getent.arrays import is_ndarray, numpy
+
+__all__ = ('NEVER', 'ShadowAudit')
+
+#: Column value for events that will never happen
+NEVER = (1 << 31) - 1
+
+#: Columns of an audit
+COLUMNS = ('age', 'expires_in', 'account_expires_in', 'disabled_in',
+           'warn', 'inactive', 'locked', 'empty')
+
+
+def _today():
+    return int(time.time() // 86400)
+
+
+class ShadowAudit(object):
+
+    """Aging data of all accounts in the shadow database.
+
+    :param source: object with a ``shadow()`` enumeration function,
+                   defaults to the :mod:`getent` module; a
+                   :class:`getent.files.Files` instance works too
+    :param today: day to count from, in days since 1970-01-01, defaults to
+                  the current day
+
+    The columns are:
+
+    ``age``
+        days since the password was last changed, ``-1`` if aging is
+        disabled; a password that must be changed at the next login is as
+        old as the epoch
+    ``expires_in``
+        days until the password expires, negative once it has
+    ``account_expires_in``
+        days until the account expires, negative once it has
+    ``disabled_in``
+        days until the account is disabled for not changing the expired
+        password
+    ``warn``
+        days before the password expires that the user is warned, ``-1``
+        if not set
+    ``inactive``
+        days after the password expired that the account is disabled,
+        ``-1`` if not set
+    ``locked``
+        ``1`` if the password is locked or logins with a password are not
+        possible at all, that is if it starts with ``!`` or ``*``, ``0``
+        otherwise
+    ``empty``
+        ``1`` if the password is empty, so that no password is needed to
+        log in, ``0`` otherwise
+    """
+
+    def __init__(self, source=None, today=None):
+        if source is None:
+            import getent as source
+        self.today = _today() if today is None else today
+        self.names = []
+
+        columns = dict((name, array.array('l')) for name in COLUMNS)
+        columns['locked'] = array.array('b')
+        columns['empty'] = array.array('b')
+        for record in source.shadow():
+            self.names.append(record.name)
+            self._append(columns, record)
+
+        np = numpy()
+        if np is not None:
+            for name, column in list(columns.items()):
+                columns[name] = np.array(column, dtype=column.typecode)
+            self.names = np.array(self.names, dtype=object)
+        self.__dict__.update(columns)
+
+    def _append(self, columns, record):
+        today = self.today
+        age = expires_in = NEVER
+        if record.change < 0:
+            age = -1
+        else:
+            age = today - record.change
+            if record.max >= 0:
+                expires_in = record.change + record.max - today
+
+        disabled_in = NEVER
+        if expires_in != NEVER and record.inact >= 0:
+            disabled_in = expires_in + record.inact
+
+        account_expires_in = NEVER
+        if record.expire >= 0:
+            account_expires_in = record.expire - today
+
+        columns['age'].append(age)
+        columns['expires_in'].append(expires_in)
+        columns['account_expires_in'].append(account_expires_in)
+        columns['disabled_in'].append(disabled_in)
+        columns['warn'].append(record.warn)
+        columns['inactive'].append(record.inact)
+        password = record.password or ''
+        columns['locked'].append(1 if password[:1] in ('!', '*') else 0)
+        columns['empty'].append(0 if password else 1)
+
+    def __len__(self):
+        return len(self.names)
+
+    def select(self, column, low=None, high=None):
+        """Get the names of accounts with `column` from `low` to `high`.
+
+        Both bounds are inclusive, and left out if ``None``.
+        """
+        values = getattr(self, column)
+        if is_ndarray(values):
+            mask = numpy().ones(len(values), dtype=bool)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            return self.names[mask].tolist()
+
+        return [name for name, value in zip(self.names, values)
+                if (low is None or value >= low) and
+                (high is None or value <= high)]
+
+    def expiring(self, days):
+        """Accounts whose password expires within `days`."""
+        return self.select('expires_in', 0, days)
+
+    def expired(self):
+        """Accounts whose password has expired."""
+        return self.select('expires_in', high=-1)
+
+    def account_expiring(self, days):
+        """Accounts that expire within `days`."""
+        return self.select('account_expires_in', 0, days)
+
+    def unchanged_for(self, days):
+        """Accounts whose password was not changed for at least `days`."""
+        return self.select('age', days)
+
+    def warning(self):
+        """Accounts whose users are being warned to change their password."""
+        values, warn = self.expires_in, self.warn
+        if is_ndarray(values):
+            mask = (values >= 0) & (values <= warn)
+            return self.names[mask].tolist()
+        return [name for name, value, days in zip(self.names, values, warn)
+                if 0 <= value <= days]
+
+    def locked_accounts(self):
+        """Accounts that can not log in with a password."""
+        return self.select('locked', 1)
+
+    def empty_passwords(self):
+        """Accounts that can log in without a password."""
+        return self.select('empty', 1)
@@ -0,0 +1,222 @@
+"""Lookup cache for the getent package.
+
+Caching is opt-in and configured per database. Once enabled, single lookups
+through :func:`getent.passwd`, :func:`getent.group` and :func:`getent.shadow`
+are answered from a bounded, least recently used cache until their time to
+live expires. Lookups that did not find anything are cached too, with their
+own (usually shorter) time to live.
+
+To cache passwd lookups for five minutes, and unknown users for ten seconds::
+
+    >>> import getent.cache
+    >>> getent.cache.enable('passwd', ttl=300, negative_ttl=10)
+
+Records are stored under both their name and their numeric id, so a lookup
+by name also answers the next lookup by id::
+
+    >>> root = getent.passwd('root')
+    >>> getent.passwd(0) is root
+    True
+
+To forget about a single entry, or everything::
+
+    >>> getent.cache.invalidate('passwd', 'root')
+    >>> getent.cache.clear()
+
+Expired records stay in the cache until they are evicted. A lookup that
+misses its deadline returns the expired record instead of failing, see
+:mod:`getent.deadlines`.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from getent import metrics as _metrics
+
+__all__ = (
+    'DATABASES',
+    'MISSING',
+    'TTLCache',
+    'clear',
+    'disable',
+    'enable',
+    'get',
+    'invalidate',
+    'peek',
+    'stale',
+)
+
+#: Databases that support caching
+DATABASES = ('passwd', 'group', 'shadow')
+
+#: Sentinel returned by :meth:`TTLCache.get` for keys that are not cached
+MISSING = object()
+
+_caches = {}
+
+
+class TTLCache(object):
+
+    """Bounded least recently used cache with expiring entries.
+
+    :param ttl: seconds a found record stays valid
+    :param negative_ttl: seconds a failed lookup (``None``) stays valid, use
+                         ``0`` to not cache failed lookups at all
+    :param maxsize: maximum number of keys kept
+    :param clock: function returning the current time in seconds
+    :param name: name to report hits and misses under, see
+                 :mod:`getent.metrics`
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30, maxsize=4096,
+                 clock=time.time, name=None):
+        self.name = name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        """Get the cached value for `key`, or `default`."""
+        value = self._get(key, default)
+        if _metrics.enabled and self.name is not None:
+            _metrics.record('cache.' + self.name,
+                            outcome='miss' if value is default else 'hit')
+        return value
+
+    def _get(self, key, default):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            # Expired entries are kept for stale(), until they are evicted
+            if entry[0] <= self.clock():
+                return default
+
+            # Re-insert to mark the entry as most recently used
+            del self._data[key]
+            self._data[key] = entry
+            return entry[1]
+
+    def peek(self, key, default=MISSING):
+        """Get the cached value for `key`, without counting a hit or miss."""
+        return self._get(key, default)
+
+    def stale(self, key, default=MISSING):
+        """Get the cached value for `key`, also if it expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[1]
+
+    def put(self, key, value, aliases=()):
+        """Cache `value` under `key` and all of its `aliases`.
+
+        A `value` of ``None`` records a failed lookup.
+        """
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if not ttl:
+            return
+
+        keys = (key,) + tuple(aliases)
+        entry = (self.clock() + ttl, value, keys)
+        with self._lock:
+            for name in keys:
+                self._data.pop(name, None)
+                self._data[name] = entry
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Remove `key`, and the other keys of the record it refers to."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return
+
+            for name in entry[2]:
+                if self._data.get(name) is entry:
+                    del self._data[name]
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+
+def enable(database, ttl=300, negative_ttl=30, maxsize=4096):
+    """Enable caching for `database`, replacing any existing cache."""
+    if database not in DATABASES:
+        raise ValueError('Caching is not supported for "%s"' % (database,))
+
+    cache = _caches[database] = TTLCache(ttl, negative_ttl, maxsize,
+                                         name=database)
+    return cache
+
+
+def disable(database=None):
+    """Disable caching for `database`, or for all databases."""
+    if database is None:
+        _caches.clear()
+    else:
+        _caches.pop(database, None)
+
+
+def get(database):
+    """Get the cache for `database`, ``None`` if caching is not enabled."""
+    return _caches.get(database)
+
+
+def peek(database, key):
+    """Get the cached record for `key`, without counting a hit or miss.
+
+    Returns :data:`MISSING` if `key` is not cached or expired, or caching
+    is not enabled for `database`.
+    """
+    cache = _caches.get(database)
+    if cache is None:
+        return MISSING
+    return cache.peek(_key(key))
+
+
+def stale(database, key):
+    """Get the cached record for `key`, also if it expired.
+
+    Returns :data:`MISSING` if `key` is not cached, or caching is not
+    enabled for `database`.
+    """
+    cache = _caches.get(database)
+    if cache is None:
+        return MISSING
+    return cache.stale(_key(key))
+
+
+def invalidate(database, key):
+    """Remove the cached record for `key` from the `database` cache."""
+    cache = _caches.get(database)
+    if cache is not None:
+        cache.invalidate(_key(key))
+
+
+def clear(database=None):
+    """Empty the cache for `database`, or for all databases."""
+    if database is None:
+        caches = list(_caches.values())
+    else:
+        caches = [_caches[database]] if database in _caches else []
+
+    for cache in caches:
+        cache.clear()
+
+
+def _key(search):
+    """Normalise a search key, numeric ids and names are kept apart."""
+    search = str(search)
+    return int(search) if search.isdigit() else search
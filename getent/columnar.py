@@ -0,0 +1,185 @@
+"""Columnar results for the getent package.
+
+A list of records keeps a Python object for every field of every entry. For
+very large directories a :class:`Table` stores each integer field in an
+:class:`array.array` instead, and every distinct string once, in a string
+table shared by all columns, so values repeated across entries such as
+shells and passwords cost a single index::
+
+    >>> users = getent.passwd(columnar=True)
+    >>> print len(users), users[0].name
+    42 root
+    >>> users.column('uid')
+    array('I', [0, 1, 2, ...])
+
+Records are only built when a row is accessed. If NumPy is installed,
+integer columns are returned as NumPy arrays sharing the table's memory.
+"""
+
+import array
+from ctypes import POINTER
+
+from getent.constants import ctypes_c_char_p
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('Table',)
+
+# Storage of fields that are not integers, integer fields are stored by
+# their array type code.
+_STRING = 'string'
+_STRINGS = 'strings'
+_OBJECT = 'object'
+
+
+def _kinds(cls):
+    """Map the fields of record class `cls` to how they are stored."""
+    types = dict(cls._struct._fields_)
+    convert = getattr(cls, '_convert', {})
+    kinds = []
+    for field in cls._fields:
+        ctype = types.get(field)
+        code = getattr(ctype, '_type_', None)
+        if ctype is None or field in convert:
+            kinds.append(_OBJECT)
+        elif ctype is ctypes_c_char_p:
+            kinds.append(_STRING)
+        elif ctype is POINTER(ctypes_c_char_p):
+            kinds.append(_STRINGS)
+        elif isinstance(code, str) and code in array.typecodes:
+            kinds.append(code)
+        else:
+            kinds.append(_OBJECT)
+    return tuple(kinds)
+
+
+class Table(object):
+
+    """Column store of records of class `cls`.
+
+    :param cls: record class, such as :class:`getent.Passwd`
+    :param records: iterable of records, consumed once
+
+    Integer fields are kept in arrays of the struct's C type, string fields
+    as indexes into :attr:`strings`, and string lists as a flat array of
+    indexes with an array of offsets per row. Other fields are kept as is.
+    """
+
+    def __init__(self, cls, records=()):
+        self.cls = cls
+        self.fields = cls._fields
+        self.strings = []
+        self._interned = {}
+        self._kinds = _kinds(cls)
+        self._columns = []
+        for kind in self._kinds:
+            if kind == _OBJECT:
+                self._columns.append([])
+            elif kind == _STRING:
+                self._columns.append(array.array('I'))
+            elif kind == _STRINGS:
+                self._columns.append((array.array('I', [0]),
+                                      array.array('I')))
+            else:
+                self._columns.append(array.array(kind))
+
+        self._length = 0
+        self._append(records)
+        # Only needed while building
+        del self._interned
+
+    def _intern(self, value):
+        index = self._interned.get(value)
+        if index is None:
+            index = self._interned[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def _append(self, records):
+        intern = self._intern
+        columns = list(zip(self._kinds, self._columns))
+        for record in records:
+            for (kind, column), value in zip(columns, record._values()):
+                if kind == _STRING:
+                    column.append(intern(value))
+                elif kind == _STRINGS:
+                    offsets, items = column
+                    items.extend([intern(item) for item in value])
+                    offsets.append(len(items))
+                else:
+                    column.append(value)
+            self._length += 1
+
+    def _value(self, position, row):
+        kind, column = self._kinds[position], self._columns[position]
+        if kind == _STRING:
+            return self.strings[column[row]]
+        elif kind == _STRINGS:
+            offsets, items = column
+            return tuple(self.strings[index]
+                         for index in items[offsets[row]:offsets[row + 1]])
+        return column[row]
+
+    def _position(self, field):
+        try:
+            return self.fields.index(field)
+        except ValueError:
+            raise KeyError(field)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, row):
+        """Build the record of `row`, or a list of records for a slice."""
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self._length))]
+
+        if row < 0:
+            row += self._length
+        if not 0 <= row < self._length:
+            raise IndexError('table index out of range')
+
+        return self.cls._make(self._value(position, row)
+                              for position in range(len(self.fields)))
+
+    def __iter__(self):
+        for row in range(self._length):
+            yield self[row]
+
+    def column(self, field):
+        """Get all values of `field`.
+
+        Integer fields are returned as an array, or a NumPy array if NumPy
+        is installed, other fields as a list.
+        """
+        position = self._position(field)
+        kind, column = self._kinds[position], self._columns[position]
+        if kind == _STRING:
+            strings = self.strings
+            return [strings[index] for index in column]
+        elif kind == _STRINGS:
+            return [self._value(position, row)
+                    for row in range(self._length)]
+        elif kind == _OBJECT:
+            return list(column)
+        elif numpy is not None and len(column):
+            return numpy.frombuffer(column, dtype=column.typecode)
+        return column
+
+    def codes(self, field):
+        """Get the :attr:`strings` indexes of string field `field`.
+
+        For string list fields the flat index array and the offsets of each
+        row in it are returned, as ``(offsets, indexes)``.
+        """
+        position = self._position(field)
+        if self._kinds[position] in (_STRING, _STRINGS):
+            return self._columns[position]
+        raise TypeError('%s is not a string field' % (field,))
+
+    def __repr__(self):
+        return '<%s of %d %s records>' % (
+            self.__class__.__name__, self._length, self.cls.__name__)
@@ -21,9 +21,23 @@ else:
 # Socket
 AF_INET = socket.AF_INET
 AF_INET6 = socket.AF_INET6
+AF_UNSPEC = socket.AF_UNSPEC
+SOCK_STREAM = socket.SOCK_STREAM
 INADDRSZ = 4
 IN6ADDRSZ = 16
 
+# Address info, from <netdb.h>
+AI_CANONNAME = 0x0002
+AI_ADDRCONFIG = getattr(socket, 'AI_ADDRCONFIG', 0x0020)
+GAI_WAIT = 0
+GAI_NOWAIT = 1
+EAI_AGAIN = -3
+EAI_INPROGRESS = -100
+EAI_CANCELED = -101
+EAI_NOTCANCELED = -102
+EAI_ALLDONE = -103
+EAI_INTR = -104
+
 # Types
 uint8_t = c_ubyte
 uint16_t = c_ushort
@@ -32,3 +46,4 @@ uid_t = c_uint
 gid_t = c_uint
 size_t = c_int
 sa_family_t = c_ushort
+socklen_t = c_uint
@@ -0,0 +1,151 @@
+"""Deadlines for lookups.
+
+NSS modules may block for as long as their servers take to answer. Every
+public lookup of the :mod:`getent` module takes a `timeout` in seconds, and
+raises :class:`Timeout` if it did not finish in time::
+
+    >>> getent.passwd('alice', timeout=0.2)
+    Traceback (most recent call last):
+      ...
+    Timeout: passwd did not finish in 0.2 seconds
+
+All lookups in a :func:`deadline` block share one deadline, the earliest
+if blocks are nested::
+
+    >>> with getent.deadline(0.5):
+    ...     user = getent.passwd('alice')
+    ...     groups = getent.groups_for_user('alice')
+
+If :mod:`getent.cache` is enabled for the database, a lookup that misses
+its deadline returns the cached record instead, even if it expired.
+
+The C library can not be interrupted, so a lookup with a deadline runs in
+a thread of its own, which is left running when the deadline passes; its
+result still ends up in the cache. Use :class:`getent.workers.WorkerPool`
+to kill lookups that hang. An enumeration that is left running keeps the
+cursor of its database locked until it is done, so later enumerations of
+that database wait for it instead of sharing the cursor.
+
+Streamed enumerations (``stream=True``) return before the C library is
+called, so there is nothing to limit: they do not take a `timeout`, and
+are not limited by a :func:`deadline` block.
+"""
+
+import contextlib
+import functools
+import threading
+import time
+
+from getent import cache as _cache
+from getent import metrics as _metrics
+
+__all__ = ('Timeout', 'deadline', 'limited', 'remaining')
+
+#: Databases whose lookup functions fall back to stale cached records
+CACHED = ('passwd', 'group', 'shadow')
+
+timer = getattr(time, 'monotonic', time.time)
+
+_local = threading.local()
+
+
+class Timeout(Exception):
+
+    """A lookup did not finish before its deadline."""
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Give all lookups in the block `seconds` to finish, together."""
+    previous = getattr(_local, 'deadline', None)
+    end = timer() + seconds
+    _local.deadline = end if previous is None else min(previous, end)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """Seconds left until the deadline of this thread, or ``None``."""
+    end = getattr(_local, 'deadline', None)
+    return None if end is None else max(0, end - timer())
+
+
+def _cached(get, name, args, kwargs):
+    """Get the cached record of a lookup with `get`, or :data:`MISSING`.
+
+    `get` is :func:`getent.cache.peek` or :func:`getent.cache.stale`.
+    """
+    search = args[0] if args else kwargs.get('search')
+    if name not in CACHED or search is None:
+        return _cache.MISSING
+    return get(name, search)
+
+
+def _run(func, args, kwargs, end):
+    """Run ``func(*args, **kwargs)`` in a thread, until `end`."""
+    result = []
+    done = threading.Event()
+
+    def call():
+        try:
+            result.append((True, func(*args, **kwargs)))
+        except Exception as error:
+            result.append((False, error))
+        finally:
+            done.set()
+
+    wait = end - timer()
+    if wait > 0:
+        thread = threading.Thread(target=call, name='getent.' + func.__name__)
+        thread.daemon = True
+        thread.start()
+        done.wait(wait)
+
+    if result:
+        found, value = result[0]
+        if found:
+            return value
+        raise value
+
+    value = _cached(_cache.stale, func.__name__, args, kwargs)
+    if value is not _cache.MISSING:
+        return value
+    raise Timeout('%s did not finish in %.3g seconds' % (
+        func.__name__, max(wait, 0)))
+
+
+def limited(func):
+    """Decorate public lookup `func` to take a `timeout` argument.
+
+    The lookup runs without a thread if neither a `timeout` nor a
+    :func:`deadline` applies, or if :mod:`getent.cache` has a fresh record
+    for it. Streamed enumerations raise :class:`ValueError` if they are
+    given a `timeout`, and ignore the :func:`deadline`.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timeout = kwargs.pop('timeout', None)
+        if kwargs.get('stream'):
+            if timeout is not None:
+                raise ValueError('streamed enumerations take no timeout')
+            return func(*args, **kwargs)
+
+        end = getattr(_local, 'deadline', None)
+        if timeout is None and end is None:
+            return func(*args, **kwargs)
+
+        # A fresh cached record is answered without a thread
+        value = _cached(_cache.peek, func.__name__, args, kwargs)
+        if value is not _cache.MISSING:
+            if _metrics.enabled:
+                _metrics.record('cache.' + func.__name__, outcome='hit')
+            return value
+
+        if timeout is not None:
+            end = timer() + timeout if end is None else min(
+                end, timer() + timeout)
+        return _run(func, args, kwargs, end)
+
+    return wrapper
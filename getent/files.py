@@ -0,0 +1,277 @@
+"""Pure Python ``files`` backend for the getent package.
+
+On hosts where nsswitch only consults local files, parsing those files in
+one go is much faster than enumerating them through libc one ``get*ent``
+call at a time. This module reads ``/etc/passwd``, ``/etc/group``,
+``/etc/shadow``, ``/etc/services`` and ``/etc/hosts`` whole, parses them in
+bulk and returns the same records as :func:`getent.passwd` and friends::
+
+    >>> from getent import files
+    >>> root = files.passwd('root')
+    >>> print root.uid
+    0
+
+Parsed files are kept until their modification time or size changes. To
+read the files below another root directory, for example a test fixture or
+a container image, use a :class:`Files` instance::
+
+    >>> fixture = files.Files('tests/fixtures')
+    >>> users = fixture.passwd()
+
+Only the files are consulted, nsswitch.conf is ignored. Like the
+``files`` NSS module, entries with malformed numeric fields are skipped.
+"""
+
+import os
+import socket
+import threading
+
+from getent import Group, Host, Passwd, Service, Shadow, convert23
+
+__all__ = ('Files', 'file_version', 'group', 'host', 'passwd', 'service',
+           'shadow')
+
+
+def file_version(path):
+    """Get what changes when `path` is written to or replaced.
+
+    Returns ``(mtime, size, inode)``, or ``None`` if `path` does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+
+def _read(path):
+    """Read all lines of `path`."""
+    with open(path, 'rb') as handle:
+        return convert23(handle.read()).splitlines()
+
+
+def _lines(path, sep, comments=False):
+    """Yield the fields of all entries in `path`.
+
+    Blank lines, lines starting with ``#`` and NIS compat entries are
+    skipped. If `comments` is set, trailing comments are removed as well.
+    """
+    for line in _read(path):
+        if comments and '#' in line:
+            line = line.split('#', 1)[0]
+        line = line.strip()
+        if line and line[0] not in '#+-':
+            yield line.split(sep)
+
+
+def _number(value, default=-1):
+    return int(value) if value else default
+
+
+def _parse_passwd(path):
+    for fields in _lines(path, ':'):
+        if len(fields) == 7:
+            name, password, uid, gid, gecos, home, shell = fields
+            try:
+                uid, gid = int(uid), int(gid)
+            except ValueError:
+                continue
+            yield Passwd._make((name, password, uid, gid, gecos, home,
+                                shell))
+
+
+def _parse_group(path):
+    for fields in _lines(path, ':'):
+        if len(fields) == 4:
+            name, password, gid, members = fields
+            try:
+                gid = int(gid)
+            except ValueError:
+                continue
+            members = tuple(members.split(',')) if members else ()
+            yield Group._make((name, password, gid, members))
+
+
+def _parse_shadow(path):
+    for fields in _lines(path, ':'):
+        if len(fields) == 9:
+            name, password, change, low, high, warn, inact, expire, flag = \
+                fields
+            try:
+                record = Shadow._make((
+                    name,
+                    password,
+                    _number(change),
+                    _number(low),
+                    _number(high),
+                    _number(warn),
+                    _number(inact),
+                    _number(expire),
+                    # libc reports an empty flag field as ~0UL
+                    _number(flag, (1 << 64) - 1),
+                ))
+            except ValueError:
+                continue
+            yield record
+
+
+def _parse_services(path):
+    for fields in _lines(path, None, comments=True):
+        if len(fields) >= 2 and '/' in fields[1]:
+            port, proto = fields[1].split('/', 1)
+            try:
+                port = int(port)
+            except ValueError:
+                continue
+            yield Service._make((fields[0], tuple(fields[2:]), port, proto))
+
+
+def _parse_hosts(path):
+    for fields in _lines(path, None, comments=True):
+        if len(fields) < 2:
+            continue
+
+        address = fields[0].split('%', 1)[0]
+        for family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                packed = socket.inet_pton(family, address)
+            except (socket.error, ValueError):
+                continue
+
+            yield Host._make((fields[1], tuple(fields[2:]), int(family),
+                              (socket.inet_ntop(family, packed),)))
+            break
+
+
+class Files(object):
+
+    """Lookups against the files below `root`.
+
+    Every database is parsed once, and parsed again only when its file
+    changes.
+    """
+
+    def __init__(self, root='/'):
+        self.root = root
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.root, 'etc', name)
+
+    def _load(self, name, parser, *keys):
+        """Parse ``etc/<name>``, returns the records and an index per key.
+
+        Each index maps the value of a record's key attribute to the first
+        record that has it.
+        """
+        path = self._path(name)
+        version = file_version(path)
+        parsed = self._parsed.get(name)
+        if parsed is not None and parsed[0] == version:
+            return parsed[1]
+
+        with self._lock:
+            records = list(parser(path))
+            indexes = []
+            for key in keys:
+                index = {}
+                for record in records:
+                    index.setdefault(getattr(record, key), record)
+                indexes.append(index)
+
+            self._parsed[name] = (version, (records, indexes))
+            return records, indexes
+
+    def passwd(self, search=None):
+        """Perform a passwd lookup, see :func:`getent.passwd`."""
+        records, (by_name, by_uid) = self._load(
+            'passwd', _parse_passwd, 'name', 'uid')
+        if search is None:
+            return list(records)
+
+        search = str(search)
+        if search.isdigit():
+            return by_uid.get(int(search))
+        return by_name.get(search)
+
+    def group(self, search=None):
+        """Perform a group lookup, see :func:`getent.group`."""
+        records, (by_name, by_gid) = self._load(
+            'group', _parse_group, 'name', 'gid')
+        if search is None:
+            return list(records)
+
+        search = str(search)
+        if search.isdigit():
+            return by_gid.get(int(search))
+        return by_name.get(search)
+
+    def shadow(self, search=None):
+        """Perform a shadow lookup, see :func:`getent.shadow`."""
+        records, (by_name,) = self._load('shadow', _parse_shadow, 'name')
+        if search is None:
+            return list(records)
+        return by_name.get(str(search))
+
+    def service(self, search=None, protocol=None):
+        """Perform a service lookup, see :func:`getent.service`."""
+        records, _ = self._load('services', _parse_services)
+        if search is None:
+            return list(records)
+
+        search = str(search)
+        if not protocol and '/' in search:
+            protocol, search = search.split('/')
+
+        for record in records:
+            if protocol and record.proto != protocol:
+                continue
+            if search.isdigit():
+                if record.port == int(search):
+                    return record
+            elif record.name == search or search in record.aliases:
+                return record
+
+    def host(self, search=None):
+        """Perform a host lookup, see :func:`getent.host`."""
+        records, _ = self._load('hosts', _parse_hosts)
+        if search is None:
+            return list(records)
+
+        search = str(search)
+        for family in (socket.AF_INET6, socket.AF_INET):
+            try:
+                address = socket.inet_ntop(
+                    family, socket.inet_pton(family, search))
+            except (socket.error, ValueError):
+                continue
+
+            for record in records:
+                if address in record.addresses:
+                    return record
+            return None
+
+        search = search.lower()
+        for record in records:
+            if record.name.lower() == search or search in [
+                    alias.lower() for alias in record.aliases]:
+                return record
+
+
+_files = Files()
+
+#: Perform a passwd lookup in ``/etc/passwd``
+passwd = _files.passwd
+
+#: Perform a group lookup in ``/etc/group``
+group = _files.group
+
+#: Perform a shadow lookup in ``/etc/shadow``
+shadow = _files.shadow
+
+#: Perform a service lookup in ``/etc/services``
+service = _files.service
+
+#: Perform a host lookup in ``/etc/hosts``
+host = _files.host
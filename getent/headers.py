@@ -4,13 +4,16 @@
 
 from ctypes import ARRAY, POINTER
 from ctypes import Structure, Union
-from ctypes import c_int, c_long, c_ulong, c_void_p
+from ctypes import c_char, c_int, c_long, c_ulong, c_void_p
 
 from getent.constants import ctypes_c_char_p
-from getent.constants import size_t, uint8_t, uint16_t, uint32_t
+from getent.constants import gid_t, sa_family_t, size_t, socklen_t, uid_t
+from getent.constants import uint8_t, uint16_t, uint32_t
 
 __all__ = (
+    'AddrInfoStruct',
     'AliasStruct',
+    'GaicbStruct',
     'GroupStruct',
     'NetgroupStruct',
     'HostStruct',
@@ -23,6 +26,10 @@ __all__ = (
     'RPCStruct',
     'ServiceStruct',
     'ShadowStruct',
+    'SockAddrIn6Struct',
+    'SockAddrInStruct',
+    'SockAddrStruct',
+    'TimespecStruct',
 )
 
 
@@ -68,6 +75,82 @@ class InAddr6Struct(Structure):
     ]
 
 
+class SockAddrStruct(Structure):
+
+    """Struct `sockaddr` from `<sys/socket.h>`."""
+
+    _fields_ = [
+        ('family', sa_family_t),
+        ('data', ARRAY(c_char, 14)),
+    ]
+
+
+class SockAddrInStruct(Structure):
+
+    """Struct `sockaddr_in` from `<netinet/in.h>`."""
+
+    _fields_ = [
+        ('family', sa_family_t),
+        ('port', uint16_t),
+        ('addr', InAddrStruct),
+        ('zero', ARRAY(uint8_t, 8)),
+    ]
+
+
+class SockAddrIn6Struct(Structure):
+
+    """Struct `sockaddr_in6` from `<netinet/in.h>`."""
+
+    _fields_ = [
+        ('family', sa_family_t),
+        ('port', uint16_t),
+        ('flowinfo', uint32_t),
+        ('addr', InAddr6Struct),
+        ('scope_id', uint32_t),
+    ]
+
+
+class AddrInfoStruct(Structure):
+
+    """Struct `addrinfo` from `<netdb.h>`."""
+
+
+AddrInfoStruct._fields_ = [
+    ('flags', c_int),
+    ('family', c_int),
+    ('socktype', c_int),
+    ('protocol', c_int),
+    ('addrlen', socklen_t),
+    ('addr', POINTER(SockAddrStruct)),
+    ('canonname', ctypes_c_char_p),
+    ('next', POINTER(AddrInfoStruct)),
+]
+
+
+class GaicbStruct(Structure):
+
+    """Struct `gaicb` from `<netdb.h>`."""
+
+    _fields_ = [
+        ('name', ctypes_c_char_p),
+        ('service', ctypes_c_char_p),
+        ('request', POINTER(AddrInfoStruct)),
+        ('result', POINTER(AddrInfoStruct)),
+        ('_return', c_int),
+        ('_reserved', ARRAY(c_int, 5)),
+    ]
+
+
+class TimespecStruct(Structure):
+
+    """Struct `timespec` from `<time.h>`."""
+
+    _fields_ = [
+        ('sec', c_long),
+        ('nsec', c_long),
+    ]
+
+
 class HostStruct(Structure):
 
     """Struct `hostent` from `<netdb.h>`."""
@@ -149,7 +232,7 @@ class GroupStruct(Structure):
     _fields_ = [
         ("name", ctypes_c_char_p),
         ("password", ctypes_c_char_p),
-        ("gid", c_int),
+        ("gid", gid_t),
         ("members", POINTER(ctypes_c_char_p)),
     ]
 
@@ -161,8 +244,8 @@ class PasswdStruct(Structure):
     _fields_ = [
         ('name', ctypes_c_char_p),
         ('password', ctypes_c_char_p),
-        ('uid', c_int),
-        ('gid', c_int),
+        ('uid', uid_t),
+        ('gid', gid_t),
         ('gecos', ctypes_c_char_p),
         ('dir', ctypes_c_char_p),
         ('shell', ctypes_c_char_p),
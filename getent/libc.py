@@ -1,15 +1,23 @@
-"""Libc functions for the getent package."""
+"""Libc functions for the getent package.
+
+Loading the C library and binding its functions is deferred until they are
+first used, so importing :mod:`getent` stays cheap. Each function is a
+:class:`Function`, which binds the underlying symbol on its first call and
+is false if the C library does not provide it.
+"""
 
 # pylint: disable=invalid-name
 
+import sys
 from ctypes import CDLL, POINTER
-from ctypes import c_int, c_void_p, c_uint
-from ctypes.util import find_library
+from ctypes import c_int, c_void_p, c_uint, c_size_t
 
 from getent import headers
 from getent.constants import ctypes_c_char_p, gid_t, uid_t
 
 __all__ = (
+    'Function',
+    'endaliasent',
     'endgrent',
     'endnetgrent',
     'endhostent',
@@ -19,30 +27,57 @@ __all__ = (
     'endrpcent',
     'endservent',
     'endspent',
+    'freeaddrinfo',
+    'gai_cancel',
+    'gai_error',
+    'gai_strerror',
+    'gai_suspend',
+    'getaddrinfo',
+    'getaddrinfo_a',
+    'getaliasent',
     'getgrent',
     'getnetgrent',
     'getgrgid',
+    'getgrgid_r',
+    'getgrouplist',
     'getgrnam',
+    'getgrnam_r',
     'gethostbyaddr',
+    'gethostbyaddr_r',
     'gethostbyname2',
+    'gethostbyname2_r',
     'gethostent',
     'getnetbyname',
+    'getnetbyname_r',
     'getnetent',
     'getprotobyname',
+    'getprotobyname_r',
     'getprotobynumber',
+    'getprotobynumber_r',
     'getprotoent',
     'getpwent',
     'getpwnam',
+    'getpwnam_r',
     'getpwuid',
+    'getpwuid_r',
     'getrpcbyname',
+    'getrpcbyname_r',
     'getrpcbynumber',
+    'getrpcbynumber_r',
     'getrpcent',
     'getservbyname',
+    'getservbyname_r',
     'getservbyport',
+    'getservbyport_r',
     'getservent',
     'getspent',
+    'getspnam',
+    'getspnam_r',
     'inet_pton',
+    'innetgr',
+    'libanl',
     'libc',
+    'setaliasent',
     'setgrent',
     'setnetgrent',
     'sethostent',
@@ -54,185 +89,324 @@ __all__ = (
     'setspent',
 )
 
+#: Well known C library names, tried before searching for the library
+SONAMES = ('libc.so.6', 'libc.so.7', 'libc.dylib', 'libc.so')
+
+
+def _load_libc():
+    """Load the C library.
+
+    The C library is normally already loaded into the process, so first try
+    the global symbol namespace and well known library names, and only fall
+    back to :func:`ctypes.util.find_library`, which may run ``ldconfig`` or a
+    compiler, if those fail.
+    """
+    if sys.platform != 'win32':
+        lib = CDLL(None)
+        if hasattr(lib, 'getpwnam'):
+            return lib
+
+    for name in SONAMES:
+        try:
+            return CDLL(name)
+        except OSError:
+            pass
+
+    from ctypes.util import find_library
+    return CDLL(find_library('c'))
+
+
+def _load_libanl():
+    """Load the library for asynchronous name resolution.
+
+    These functions live in libanl before glibc 2.34.
+    """
+    if hasattr(libc, 'getaddrinfo_a'):
+        return libc
+
+    from ctypes.util import find_library
+    name = find_library('anl')
+    return CDLL(name) if name else None
+
+
+class Library(object):
+
+    """A shared library that is loaded on first attribute access."""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lib = None
+
+    def __getattr__(self, name):
+        if self._lib is None:
+            self._lib = self._loader() or False
+        if not self._lib:
+            raise AttributeError(name)
+        return getattr(self._lib, name)
+
+
+class Function(object):
+
+    """A C library function that is bound on first use.
+
+    Instances are false if the library does not provide the function, and
+    raise :class:`NotImplementedError` when called in that case.
+    """
+
+    __slots__ = ('name', 'restype', 'argtypes', 'library', '_func')
+
+    def __init__(self, name, restype=c_int, argtypes=None, library=None):
+        self.name = name
+        self.restype = restype
+        self.argtypes = argtypes
+        self.library = library
+        self._func = None
+
+    def bind(self):
+        """Bind the C function, returns it or ``False`` if it is missing."""
+        if self._func is None:
+            try:
+                func = getattr(self.library or libc, self.name)
+            except AttributeError:
+                func = False
+            else:
+                func.restype = self.restype
+                if self.argtypes is not None:
+                    func.argtypes = self.argtypes
+            self._func = func
+        return self._func
+
+    def __call__(self, *args):
+        func = self._func or self.bind()
+        if not func:
+            raise NotImplementedError('%s is not available on %s' % (
+                self.name, sys.platform))
+        return func(*args)
+
+    def __bool__(self):
+        return bool(self._func if self._func is not None else self.bind())
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.name)
+
+
 #: libc object
-libc = CDLL(find_library("c"))
+libc = Library(_load_libc)
+
+#: libanl object, which may be libc itself
+libanl = Library(_load_libanl)
 
 # Map libc function calls
 
-if hasattr(libc, 'getaliasent'):
-    endaliasent = libc.endaliasent
-    getaliasent = libc.getaliasent
-    getaliasent.restype = POINTER(headers.AliasStruct)
-    setaliasent = libc.setaliasent
-else:
-    endaliasent = None
-    getaliasent = None
-    setaliasent = None
-
-if hasattr(libc, 'gethostent'):
-    endhostent = libc.endhostent
-    gethostent = libc.gethostent
-    gethostent.restype = POINTER(headers.HostStruct)
-    sethostent = libc.sethostent
-else:
-    endhostent = None
-    gethostent = None
-    sethostent = None
-
-if hasattr(libc, 'getnetent'):
-    endnetent = libc.endnetent
-    getnetent = libc.getnetent
-    getnetent.restype = POINTER(headers.NetworkStruct)
-    setnetent = libc.setnetent
-else:
-    endnetent = None
-    getnetent = None
-    setnetent = None
-
-if hasattr(libc, 'getprotoent'):
-    endprotoent = libc.endprotoent
-    getprotoent = libc.getprotoent
-    getprotoent.restype = POINTER(headers.ProtoStruct)
-    setprotoent = libc.setprotoent
-else:
-    endprotoent = None
-    getprotoent = None
-    setprotoent = None
-
-if hasattr(libc, 'getrpcent'):
-    endrpcent = libc.endrpcent
-    getrpcent = libc.getrpcent
-    getrpcent.restype = POINTER(headers.RPCStruct)
-    setrpcent = libc.setrpcent
-else:
-    endrpcent = None
-    getrpcent = None
-    setrpcent = None
-
-if hasattr(libc, 'getservent'):
-    endservent = libc.endservent
-    getservent = libc.getservent
-    getservent.restype = POINTER(headers.ServiceStruct)
-    setservent = libc.setservent
-else:
-    endservent = None
-    getservent = None
-    setservent = None
-
-if hasattr(libc, 'getnetgrent'):
-    endnetgrent = libc.endnetgrent
-    getnetgrent = libc.getnetgrent
-    getnetgrent.restype = POINTER(headers.NetgroupStruct)
-    setnetgrent = libc.setnetgrent
-else:
-    endnetgrent = None
-    getnetgrent = None
-    setnetgrent = None
-
-if hasattr(libc, 'getgrent'):
-    endgrent = libc.endgrent
-    getgrent = libc.getgrent
-    getgrent.restype = POINTER(headers.GroupStruct)
-    setgrent = libc.setgrent
-else:
-    endgrent = None
-    getgrent = None
-    setgrent = None
-
-if hasattr(libc, 'getpwent'):
-    endpwent = libc.endpwent
-    getpwent = libc.getpwent
-    getpwent.restype = POINTER(headers.PasswdStruct)
-    setpwent = libc.setpwent
-else:
-    endpwent = None
-    getpwent = None
-    setpwent = None
-
-if hasattr(libc, 'getspent'):
-    endspent = libc.endspent
-    getspent = libc.getspent
-    getspent.restype = POINTER(headers.ShadowStruct)
-    setspent = libc.setspent
-else:
-    endspent = None
-    getspent = None
-    setspent = None
+endaliasent = Function('endaliasent')
+getaliasent = Function('getaliasent', POINTER(headers.AliasStruct))
+setaliasent = Function('setaliasent')
+
+endhostent = Function('endhostent')
+gethostent = Function('gethostent', POINTER(headers.HostStruct))
+sethostent = Function('sethostent')
+
+endnetent = Function('endnetent')
+getnetent = Function('getnetent', POINTER(headers.NetworkStruct))
+setnetent = Function('setnetent')
+
+endprotoent = Function('endprotoent')
+getprotoent = Function('getprotoent', POINTER(headers.ProtoStruct))
+setprotoent = Function('setprotoent')
+
+endrpcent = Function('endrpcent')
+getrpcent = Function('getrpcent', POINTER(headers.RPCStruct))
+setrpcent = Function('setrpcent')
+
+endservent = Function('endservent')
+getservent = Function('getservent', POINTER(headers.ServiceStruct))
+setservent = Function('setservent')
+
+endnetgrent = Function('endnetgrent')
+#: getnetgrent(host, user, domain)
+getnetgrent = Function('getnetgrent', c_int, (POINTER(ctypes_c_char_p),) * 3)
+#: setnetgrent(netgroup)
+setnetgrent = Function('setnetgrent', c_int, (ctypes_c_char_p,))
+
+endgrent = Function('endgrent')
+getgrent = Function('getgrent', POINTER(headers.GroupStruct))
+setgrent = Function('setgrent')
+
+endpwent = Function('endpwent')
+getpwent = Function('getpwent', POINTER(headers.PasswdStruct))
+setpwent = Function('setpwent')
+
+endspent = Function('endspent')
+getspent = Function('getspent', POINTER(headers.ShadowStruct))
+setspent = Function('setspent')
 
 #: inet_pton(family, src, dst)
-inet_pton = libc.inet_pton
-inet_pton.argtypes = (c_int, ctypes_c_char_p, c_void_p)
-inet_pton.restype = c_int
+inet_pton = Function('inet_pton', c_int, (c_int, ctypes_c_char_p, c_void_p))
 
-#: gethostbyaddr(addr)
-gethostbyaddr = libc.gethostbyaddr
-gethostbyaddr.argtypes = (c_void_p, )
-gethostbyaddr.restype = POINTER(headers.HostStruct)
+#: gethostbyaddr(addr, len, type)
+gethostbyaddr = Function('gethostbyaddr', POINTER(headers.HostStruct),
+                         (c_void_p, c_uint, c_int))
 
 #: gethostbyname2(name, family)
-gethostbyname2 = libc.gethostbyname2
-gethostbyname2.argtypes = (ctypes_c_char_p, c_uint)
-gethostbyname2.restype = POINTER(headers.HostStruct)
+gethostbyname2 = Function('gethostbyname2', POINTER(headers.HostStruct),
+                          (ctypes_c_char_p, c_uint))
 
 #: getnetbyname(name)
-getnetbyname = libc.getnetbyname
-getnetbyname.argtypes = (ctypes_c_char_p,)
-getnetbyname.restype = POINTER(headers.NetworkStruct)
+getnetbyname = Function('getnetbyname', POINTER(headers.NetworkStruct),
+                        (ctypes_c_char_p,))
 
 #: getgrnam(name)
-getgrnam = libc.getgrnam
-getgrnam.argtypes = (ctypes_c_char_p,)
-getgrnam.restype = POINTER(headers.GroupStruct)
+getgrnam = Function('getgrnam', POINTER(headers.GroupStruct),
+                    (ctypes_c_char_p,))
 
 #: getgrgid(gid)
-getgrgid = libc.getgrgid
-getgrgid.argtypes = (gid_t,)
-getgrgid.restype = POINTER(headers.GroupStruct)
+getgrgid = Function('getgrgid', POINTER(headers.GroupStruct), (gid_t,))
+
+#: getgrouplist(user, group, groups, ngroups)
+getgrouplist = Function('getgrouplist', c_int, (ctypes_c_char_p, gid_t,
+                                               POINTER(gid_t), POINTER(c_int)))
+
+#: innetgr(netgroup, host, user, domain)
+innetgr = Function('innetgr', c_int, (ctypes_c_char_p,) * 4)
 
 #: getpwnam(name)
-getpwnam = libc.getpwnam
-getpwnam.argtypes = (ctypes_c_char_p,)
-getpwnam.restype = POINTER(headers.PasswdStruct)
+getpwnam = Function('getpwnam', POINTER(headers.PasswdStruct),
+                    (ctypes_c_char_p,))
 
 #: getpwuid(uid)
-getpwuid = libc.getpwuid
-getpwuid.argtypes = (uid_t,)
-getpwuid.restype = POINTER(headers.PasswdStruct)
+getpwuid = Function('getpwuid', POINTER(headers.PasswdStruct), (uid_t,))
 
 #: getprotobyname(name)
-getprotobyname = libc.getprotobyname
-getprotobyname.argtypes = (ctypes_c_char_p,)
-getprotobyname.restype = POINTER(headers.ProtoStruct)
+getprotobyname = Function('getprotobyname', POINTER(headers.ProtoStruct),
+                          (ctypes_c_char_p,))
 
 #: getprotobynumber(n)
-getprotobynumber = libc.getprotobynumber
-getprotobynumber.argtypes = (c_int,)
-getprotobynumber.restype = POINTER(headers.ProtoStruct)
+getprotobynumber = Function('getprotobynumber', POINTER(headers.ProtoStruct),
+                            (c_int,))
 
 #: getrpcbyname(name)
-getrpcbyname = libc.getrpcbyname
-getrpcbyname.argtypes = (ctypes_c_char_p,)
-getrpcbyname.restype = POINTER(headers.RPCStruct)
+getrpcbyname = Function('getrpcbyname', POINTER(headers.RPCStruct),
+                        (ctypes_c_char_p,))
 
 #: getrpcbynumber(n)
-getrpcbynumber = libc.getrpcbynumber
-getrpcbynumber.argtypes = (c_int,)
-getrpcbynumber.restype = POINTER(headers.RPCStruct)
+getrpcbynumber = Function('getrpcbynumber', POINTER(headers.RPCStruct),
+                          (c_int,))
 
 #: getservbyname(name)
-getservbyname = libc.getservbyname
-getservbyname.argtypes = (ctypes_c_char_p, ctypes_c_char_p)
-getservbyname.restype = POINTER(headers.ServiceStruct)
+getservbyname = Function('getservbyname', POINTER(headers.ServiceStruct),
+                         (ctypes_c_char_p, ctypes_c_char_p))
 
 #: getservbyport(port)
-getservbyport = libc.getservbyport
-getservbyport.argtypes = (c_int, ctypes_c_char_p)
-getservbyport.restype = POINTER(headers.ServiceStruct)
-
-# Not supported on all platforms
-try:
-    getspnam = libc.getspnam
-    getspnam.argtypes = (ctypes_c_char_p,)
-    getspnam.restype = POINTER(headers.ShadowStruct)
-except AttributeError:
-    getspnam = None
+getservbyport = Function('getservbyport', POINTER(headers.ServiceStruct),
+                         (c_int, ctypes_c_char_p))
+
+#: getspnam(name), not supported on all platforms
+getspnam = Function('getspnam', POINTER(headers.ShadowStruct),
+                    (ctypes_c_char_p,))
+
+# Reentrant variants, these fill a caller supplied struct and buffer instead
+# of libc's static storage. See :mod:`getent.reentrant`.
+
+#: getpwnam_r(name, pwd, buf, buflen, result)
+getpwnam_r = Function('getpwnam_r', c_int, (
+    ctypes_c_char_p, POINTER(headers.PasswdStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.PasswdStruct))))
+
+#: getpwuid_r(uid, pwd, buf, buflen, result)
+getpwuid_r = Function('getpwuid_r', c_int, (
+    uid_t, POINTER(headers.PasswdStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.PasswdStruct))))
+
+#: getgrnam_r(name, grp, buf, buflen, result)
+getgrnam_r = Function('getgrnam_r', c_int, (
+    ctypes_c_char_p, POINTER(headers.GroupStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.GroupStruct))))
+
+#: getgrgid_r(gid, grp, buf, buflen, result)
+getgrgid_r = Function('getgrgid_r', c_int, (
+    gid_t, POINTER(headers.GroupStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.GroupStruct))))
+
+#: getspnam_r(name, spwd, buf, buflen, result)
+getspnam_r = Function('getspnam_r', c_int, (
+    ctypes_c_char_p, POINTER(headers.ShadowStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.ShadowStruct))))
+
+#: gethostbyaddr_r(addr, len, type, ret, buf, buflen, result, h_errnop)
+gethostbyaddr_r = Function('gethostbyaddr_r', c_int, (
+    c_void_p, c_uint, c_int, POINTER(headers.HostStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.HostStruct)), POINTER(c_int)))
+
+#: gethostbyname2_r(name, af, ret, buf, buflen, result, h_errnop)
+gethostbyname2_r = Function('gethostbyname2_r', c_int, (
+    ctypes_c_char_p, c_int, POINTER(headers.HostStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.HostStruct)), POINTER(c_int)))
+
+#: getnetbyname_r(name, ret, buf, buflen, result, h_errnop)
+getnetbyname_r = Function('getnetbyname_r', c_int, (
+    ctypes_c_char_p, POINTER(headers.NetworkStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.NetworkStruct)), POINTER(c_int)))
+
+#: getprotobyname_r(name, ret, buf, buflen, result)
+getprotobyname_r = Function('getprotobyname_r', c_int, (
+    ctypes_c_char_p, POINTER(headers.ProtoStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.ProtoStruct))))
+
+#: getprotobynumber_r(n, ret, buf, buflen, result)
+getprotobynumber_r = Function('getprotobynumber_r', c_int, (
+    c_int, POINTER(headers.ProtoStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.ProtoStruct))))
+
+#: getrpcbyname_r(name, ret, buf, buflen, result)
+getrpcbyname_r = Function('getrpcbyname_r', c_int, (
+    ctypes_c_char_p, POINTER(headers.RPCStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.RPCStruct))))
+
+#: getrpcbynumber_r(n, ret, buf, buflen, result)
+getrpcbynumber_r = Function('getrpcbynumber_r', c_int, (
+    c_int, POINTER(headers.RPCStruct), c_void_p, c_size_t,
+    POINTER(POINTER(headers.RPCStruct))))
+
+#: getservbyname_r(name, proto, ret, buf, buflen, result)
+getservbyname_r = Function('getservbyname_r', c_int, (
+    ctypes_c_char_p, ctypes_c_char_p, POINTER(headers.ServiceStruct),
+    c_void_p, c_size_t, POINTER(POINTER(headers.ServiceStruct))))
+
+#: getservbyport_r(port, proto, ret, buf, buflen, result)
+getservbyport_r = Function('getservbyport_r', c_int, (
+    c_int, ctypes_c_char_p, POINTER(headers.ServiceStruct),
+    c_void_p, c_size_t, POINTER(POINTER(headers.ServiceStruct))))
+
+#: getaddrinfo(node, service, hints, res)
+getaddrinfo = Function('getaddrinfo', c_int, (
+    ctypes_c_char_p, ctypes_c_char_p, POINTER(headers.AddrInfoStruct),
+    POINTER(POINTER(headers.AddrInfoStruct))))
+
+# Asynchronous name resolution, these live in libanl before glibc 2.34
+
+#: getaddrinfo_a(mode, list, nitems, sevp)
+getaddrinfo_a = Function('getaddrinfo_a', c_int, (
+    c_int, POINTER(POINTER(headers.GaicbStruct)), c_int, c_void_p),
+    library=libanl)
+
+#: gai_suspend(list, nitems, timeout)
+gai_suspend = Function('gai_suspend', c_int, (
+    POINTER(POINTER(headers.GaicbStruct)), c_int,
+    POINTER(headers.TimespecStruct)), library=libanl)
+
+#: gai_error(req)
+gai_error = Function('gai_error', c_int, (POINTER(headers.GaicbStruct),),
+                     library=libanl)
+
+#: gai_cancel(req)
+gai_cancel = Function('gai_cancel', c_int, (POINTER(headers.GaicbStruct),),
+                      library=libanl)
+
+#: freeaddrinfo(res)
+freeaddrinfo = Function('freeaddrinfo', None,
+                        (POINTER(headers.AddrInfoStruct),))
+
+#: gai_strerror(errcode)
+gai_strerror = Function('gai_strerror', ctypes_c_char_p, (c_int,))
@@ -0,0 +1,249 @@
+"""Optional instrumentation for the getent package.
+
+When enabled, every call into libc and every public lookup is counted and
+timed, per function::
+
+    >>> from getent import metrics
+    >>> metrics.enable()
+    >>> getent.passwd('root')
+    >>> print metrics.stats()['passwd']['outcomes']
+    {'found': 1}
+
+Public lookups report their outcome, ``found``, ``notfound`` or ``error``,
+and enumerations their number of records. Enabled lookup caches report a
+``hit`` or ``miss`` under ``cache.<database>``, libc functions are reported
+as ``libc.<function>``. Every measurement is also passed to the hooks, to
+export it to a metrics system::
+
+    >>> def hook(name, seconds, outcome, size):
+    ...     statsd.timing('getent.' + name, seconds)
+    >>> metrics.add_hook(hook)
+
+Instrumentation is disabled by default. While disabled, public lookups only
+check a flag, and libc functions are called without any extra cost.
+"""
+
+import functools
+import threading
+import time
+import types
+from bisect import bisect_left
+
+__all__ = (
+    'BUCKETS',
+    'SIZES',
+    'Histogram',
+    'add_hook',
+    'disable',
+    'enable',
+    'instrument',
+    'record',
+    'remove_hook',
+    'reset',
+    'stats',
+)
+
+#: Whether instrumentation is enabled, see :func:`enable`
+enabled = False
+
+#: Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+           1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+#: Upper bounds of the enumeration size histogram buckets
+SIZES = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+timer = getattr(time, 'perf_counter', time.time)
+
+_stats = {}
+_hooks = []
+_lock = threading.Lock()
+_call = None
+
+
+class Histogram(object):
+
+    """Counts of observed values per bucket.
+
+    The last bucket counts the values above the largest of `bounds`.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        """Count `value` in its bucket."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        """Get the histogram as a plain dictionary."""
+        return {
+            'buckets': list(zip(self.bounds + (float('inf'),), self.counts)),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class _Stats(object):
+
+    """Measurements of one function."""
+
+    def __init__(self):
+        self.calls = 0
+        self.outcomes = {}
+        self.latency = Histogram(BUCKETS)
+        self.sizes = Histogram(SIZES)
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'outcomes': dict(self.outcomes),
+            'latency': self.latency.as_dict(),
+            'sizes': self.sizes.as_dict(),
+        }
+
+
+def record(name, seconds=None, outcome=None, size=None):
+    """Record one call of `name`, and pass it on to the hooks.
+
+    :param seconds: time the call took, if it was timed
+    :param outcome: what the call found, such as ``'found'`` or ``'hit'``
+    :param size: number of records an enumeration returned
+    """
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = _Stats()
+        stat.calls += 1
+        if outcome is not None:
+            stat.outcomes[outcome] = stat.outcomes.get(outcome, 0) + 1
+        if seconds is not None:
+            stat.latency.observe(seconds)
+        if size is not None:
+            stat.sizes.observe(size)
+
+    for hook in list(_hooks):
+        hook(name, seconds, outcome, size)
+
+
+def stats():
+    """Get all measurements so far, as a mapping of name to a dict."""
+    with _lock:
+        return dict((name, stat.as_dict()) for name, stat in _stats.items())
+
+
+def reset():
+    """Forget all measurements."""
+    with _lock:
+        _stats.clear()
+
+
+def add_hook(hook):
+    """Call ``hook(name, seconds, outcome, size)`` for every measurement.
+
+    Hooks run in the thread that made the call, and must not raise.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Stop calling `hook`."""
+    _hooks.remove(hook)
+
+
+def _timed(call):
+    """Wrap ``Function.__call__`` to time libc calls."""
+    @functools.wraps(call)
+    def timed_call(function, *args):
+        start = timer()
+        outcome = 'error'
+        try:
+            res = call(function, *args)
+            outcome = None
+            return res
+        finally:
+            record('libc.' + function.name, timer() - start, outcome)
+    return timed_call
+
+
+def enable():
+    """Start measuring."""
+    global enabled, _call
+    from getent.libc import Function
+
+    with _lock:
+        if _call is None:
+            _call = Function.__call__
+            Function.__call__ = _timed(_call)
+        enabled = True
+
+
+def disable():
+    """Stop measuring, the measurements so far are kept."""
+    global enabled, _call
+    from getent.libc import Function
+
+    with _lock:
+        if _call is not None:
+            Function.__call__ = _call
+            _call = None
+        enabled = False
+
+
+def _counted(name, start, records):
+    """Pass on streamed `records`, and record them once exhausted."""
+    count, outcome = 0, 'found'
+    try:
+        for item in records:
+            count += 1
+            yield item
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        records.close()
+        record(name, timer() - start, outcome, count)
+
+
+def instrument(func=None, sized=True):
+    """Decorate public lookup `func` to measure it when enabled.
+
+    A result of ``None`` or ``False`` is counted as ``notfound``. If `sized`
+    is set, the size of results that are not records, such as the list of an
+    enumeration, is recorded too; lookups that return a list for a single
+    key use ``@instrument(sized=False)``.
+    """
+    if func is None:
+        return functools.partial(instrument, sized=sized)
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+
+        start = timer()
+        try:
+            res = func(*args, **kwargs)
+        except Exception:
+            record(name, timer() - start, 'error')
+            raise
+
+        if isinstance(res, types.GeneratorType):
+            return _counted(name, start, res)
+        elif res is None or res is False:
+            record(name, timer() - start, 'notfound')
+        elif (sized and hasattr(res, '__len__') and
+              not hasattr(res, '_fields')):
+            record(name, timer() - start, 'found', len(res))
+        else:
+            record(name, timer() - start, 'found')
+        return res
+
+    return wrapper
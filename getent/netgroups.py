@@ -0,0 +1,273 @@
+"""Cached netgroup membership tests.
+
+:func:`getent.innetgr` asks NSS on every call, which for NIS or LDAP
+netgroups means a round trip per test. A :class:`NetgroupIndex` expands each
+netgroup once, including the members of nested netgroups, and answers
+membership tests from memory until the expansion is `ttl` seconds old::
+
+    >>> netgroups = getent.NetgroupIndex(['trusted', 'admins'], ttl=300)
+    >>> netgroups.contains('trusted', host='db1', user='alice')
+    True
+    >>> netgroups.members('trusted', user='bob')
+    (('web1', 'bob', None),)
+
+Netgroups that are not in the index yet are expanded on first use. Like
+:func:`getent.innetgr`, a key that is ``None`` matches any member, a member
+that is ``None`` (a wildcard) matches any key, and hosts and domains are
+compared regardless of case.
+
+The index also maps hosts, users and domains back to the netgroups that
+contain them, which takes one pass over all netgroups. NSS can not
+enumerate netgroups, so the names are read from ``/etc/netgroup`` unless
+they are given::
+
+    >>> netgroups = getent.NetgroupIndex(['trusted', 'admins', 'web'])
+    >>> netgroups.netgroups(host='web1')
+    ['admins', 'trusted']
+    >>> netgroups.netgroups(user='alice', host='db1')
+    ['trusted']
+
+When a netgroup changes, :meth:`NetgroupIndex.update` expands it again and
+only replaces its own entries in the reverse maps. The C library expands
+nested netgroups into the netgroups that include them, so update those as
+well.
+"""
+
+import threading
+import time
+
+__all__ = ('NetgroupIndex', 'netgroup_names')
+
+#: Fields of a netgroup member
+FIELDS = ('host', 'user', 'domain')
+
+#: File that defines the netgroups when nsswitch uses ``files``
+PATH = '/etc/netgroup'
+
+
+def netgroup_names(path=PATH):
+    """Get the names of the netgroups defined in `path`.
+
+    Returns an empty list if the file does not exist.
+    """
+    try:
+        with open(path) as handle:
+            data = handle.read()
+    except (IOError, OSError):
+        return []
+
+    names = []
+    for line in data.replace('\\\n', ' ').splitlines():
+        fields = line.split('#', 1)[0].split()
+        if fields and fields[0] not in names:
+            names.append(fields[0])
+    return names
+
+
+def _fold(field, value):
+    """Fold `value` for comparison, hosts and domains ignore case."""
+    if value is None or FIELDS[field] == 'user':
+        return value
+    return value.lower()
+
+
+def _folded(triple):
+    return tuple(_fold(field, value) for field, value in enumerate(triple))
+
+
+class _Expansion(object):
+
+    """Expanded members of one netgroup, indexed per field."""
+
+    __slots__ = ('netgroup', 'expires', 'index')
+
+    def __init__(self, netgroup, expires):
+        self.netgroup = netgroup
+        self.expires = expires
+        # Per field, the positions of the members by value, with the
+        # wildcard members under None.
+        self.index = ({}, {}, {})
+        for position, member in enumerate(netgroup.members):
+            for field, value in enumerate(_folded(member)):
+                self.index[field].setdefault(value, []).append(position)
+
+    def find(self, keys):
+        """Yield the members that match all `keys` that are not ``None``."""
+        members = self.netgroup.members
+        given = [(field, key) for field, key in enumerate(_folded(keys))
+                 if key is not None]
+        if not given:
+            for member in members:
+                yield member
+            return
+
+        # Start from the members that match the most selective key
+        field, key = min(given, key=lambda given: len(
+            self.index[given[0]].get(given[1], ())))
+        positions = (self.index[field].get(key, []) +
+                     self.index[field].get(None, []))
+        for position in sorted(positions):
+            member = members[position]
+            folded = _folded(member)
+            if all(folded[other] is None or folded[other] == value
+                   for other, value in given):
+                yield member
+
+
+class NetgroupIndex(object):
+
+    """Expanded netgroups, refreshed when they are older than `ttl`.
+
+    :param names: names of the netgroups to expand up front, defaults to
+                  those in :data:`PATH`; other netgroups are expanded when
+                  they are first queried
+    :param ttl: seconds an expansion stays valid, ``None`` to keep it until
+                it is updated
+    :param source: object with a ``netgroup(name)`` lookup function,
+                   defaults to the :mod:`getent` module
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self, names=None, ttl=300, source=None, clock=time.time):
+        if source is None:
+            import getent as source
+        self.source = source
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        # The netgroup cursor of the C library is global to the process
+        self._cursor = threading.Lock()
+        self._expansions = {}
+        # Per field, the netgroups that have a member with a value, with the
+        # netgroups that have a wildcard member under None.
+        self._reverse = ({}, {}, {})
+        self._next_refresh = None
+        for name in netgroup_names() if names is None else names:
+            self.update(name)
+
+    @property
+    def names(self):
+        """Names of the netgroups in the index."""
+        return tuple(sorted(self._expansions))
+
+    def _forget(self, name):
+        """Remove netgroup `name` from the index, with the lock held."""
+        expansion = self._expansions.pop(name, None)
+        if expansion is None:
+            return
+        for index, reverse in zip(expansion.index, self._reverse):
+            for value in index:
+                names = reverse[value]
+                names.discard(name)
+                if not names:
+                    del reverse[value]
+
+    def update(self, name):
+        """Expand netgroup `name` again, and replace it in the index.
+
+        Returns the netgroup.
+        """
+        with self._cursor:
+            netgroup = self.source.netgroup(name)
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        expansion = _Expansion(netgroup, expires)
+
+        with self._lock:
+            self._forget(name)
+            self._expansions[name] = expansion
+            for index, reverse in zip(expansion.index, self._reverse):
+                for value in index:
+                    reverse.setdefault(value, set()).add(name)
+            if expires is not None and (self._next_refresh is None or
+                                        expires < self._next_refresh):
+                self._next_refresh = expires
+        return netgroup
+
+    def _get(self, name):
+        expansion = self._expansions.get(name)
+        if expansion is None or (expansion.expires is not None and
+                                 expansion.expires <= self.clock()):
+            self.update(name)
+            expansion = self._expansions[name]
+        return expansion
+
+    def refresh(self, force=False):
+        """Expand the netgroups that expired again, or all if `force` is set.
+
+        Returns the names of the netgroups that were expanded.
+        """
+        now = self.clock()
+        with self._lock:
+            expanded = [name for name, expansion in self._expansions.items()
+                        if force or (expansion.expires is not None and
+                                     expansion.expires <= now)]
+            self._next_refresh = None
+        for name in expanded:
+            self.update(name)
+
+        with self._lock:
+            expires = [expansion.expires
+                       for expansion in self._expansions.values()
+                       if expansion.expires is not None]
+            self._next_refresh = min(expires) if expires else None
+        return expanded
+
+    def invalidate(self, name=None):
+        """Forget the expansion of netgroup `name`, or of all netgroups."""
+        with self._lock:
+            for name in [name] if name is not None else list(
+                    self._expansions):
+                self._forget(name)
+
+    def netgroup(self, name):
+        """Get netgroup `name`, see :func:`getent.netgroup`."""
+        return self._get(name).netgroup
+
+    def members(self, name, host=None, user=None, domain=None):
+        """Get the ``(host, user, domain)`` members of netgroup `name`.
+
+        If `host`, `user` or `domain` is given, only the members that match.
+        """
+        return tuple(self._get(name).find((host, user, domain)))
+
+    def contains(self, name, host=None, user=None, domain=None):
+        """Test if a member of netgroup `name` matches the keys given.
+
+        Answers the same as :func:`getent.innetgr`.
+        """
+        for _ in self._get(name).find((host, user, domain)):
+            return True
+        return False
+
+    def netgroups(self, host=None, user=None, domain=None):
+        """Get the names of the netgroups in the index that match the keys.
+
+        A netgroup matches if :meth:`contains` would be true for it, so
+        netgroups with a wildcard member match any key of that field.
+        Netgroups that expired are expanded again first.
+        """
+        if (self._next_refresh is not None and
+                self._next_refresh <= self.clock()):
+            self.refresh()
+
+        keys = (host, user, domain)
+        given = [(field, key) for field, key in enumerate(_folded(keys))
+                 if key is not None]
+        with self._lock:
+            if not given:
+                return sorted(name for name, expansion
+                              in self._expansions.items()
+                              if expansion.netgroup.members)
+
+            found = None
+            for field, key in given:
+                reverse = self._reverse[field]
+                names = reverse.get(key, set()) | reverse.get(None, set())
+                found = names if found is None else found & names
+            expansions = [(name, self._expansions[name]) for name in found]
+
+        # Keys of different fields have to match the same member
+        if len(given) > 1:
+            return sorted(name for name, expansion in expansions
+                          if any(True for _ in expansion.find(keys)))
+        return sorted(name for name, _ in expansions)
@@ -0,0 +1,131 @@
+"""Reentrant lookups for the getent package.
+
+The lookup functions in :mod:`getent.libc` return pointers into static
+storage owned by libc, which the next lookup, from any thread, may overwrite.
+The functions in this module have the same signatures and return types, but
+are built on the ``*_r`` variants: every call fills its own struct, and the
+strings it points to live in a buffer owned by the calling thread. The buffer
+is reused for subsequent lookups in that thread and grown when libc reports
+``ERANGE``.
+
+A record must be copied out (which the :class:`getent.StructMap` constructors
+do) before the next lookup in the same thread reuses the buffer.
+
+Where a platform lacks a reentrant variant, the non-reentrant function from
+:mod:`getent.libc` is used instead; :func:`available` tells whether a lookup
+is really reentrant.
+"""
+
+# pylint: disable=invalid-name
+
+import threading
+from ctypes import POINTER, byref, c_int, create_string_buffer, pointer
+from errno import ERANGE
+
+from getent import headers, libc
+
+__all__ = (
+    'available',
+    'getgrgid',
+    'getgrnam',
+    'gethostbyaddr',
+    'gethostbyname2',
+    'getnetbyname',
+    'getprotobyname',
+    'getprotobynumber',
+    'getpwnam',
+    'getpwuid',
+    'getrpcbyname',
+    'getrpcbynumber',
+    'getservbyname',
+    'getservbyport',
+    'getspnam',
+)
+
+#: Initial size of the per-thread lookup buffer
+BUFFER_SIZE = 1024
+
+#: Maximum size the per-thread lookup buffer may grow to
+BUFFER_LIMIT = 1 << 24
+
+#: Lookups that are reentrant without an ``_r`` variant
+THREAD_SAFE = frozenset(['getgrouplist'])
+
+_local = threading.local()
+
+
+def _buffer(size):
+    """Return this thread's lookup buffer, at least `size` bytes large."""
+    buf = getattr(_local, 'buffer', None)
+    if buf is None or len(buf) < size:
+        buf = _local.buffer = create_string_buffer(size)
+    return buf
+
+
+def _call(func, struct, args, herrno):
+    """Call reentrant `func`, growing the thread's buffer on ``ERANGE``.
+
+    Returns a pointer to the result struct, which is ``NULL`` if the lookup
+    did not find anything.
+    """
+    ent = struct()
+    result = POINTER(struct)()
+    size = max(BUFFER_SIZE, len(getattr(_local, 'buffer', b'')))
+    while True:
+        buf = _buffer(size)
+        if herrno:
+            err = func(*(args + (byref(ent), buf, size, byref(result),
+                                 byref(c_int()))))
+        else:
+            err = func(*(args + (byref(ent), buf, size, byref(result))))
+
+        if err != ERANGE or size >= BUFFER_LIMIT:
+            break
+        size *= 2
+
+    if result:
+        # A pointer that keeps the struct alive, unlike the one libc filled
+        return pointer(ent)
+    return result
+
+
+def available(name):
+    """Whether lookup `name`, say ``'getpwnam'``, is reentrant."""
+    if name in THREAD_SAFE:
+        return bool(getattr(libc, name))
+    return bool(getattr(libc, name + '_r'))
+
+
+def _bind(name, struct, herrno=False):
+    """Return a reentrant version of lookup `name`.
+
+    Falls back to the non-reentrant :mod:`getent.libc` function if the
+    platform does not offer ``<name>_r``.
+    """
+    func = getattr(libc, name + '_r')
+    fallback = getattr(libc, name)
+
+    def lookup(*args):
+        if func:
+            return _call(func, struct, args, herrno)
+        return fallback(*args)
+
+    lookup.__name__ = name
+    lookup.__doc__ = 'Reentrant ``%s``, using ``%s_r``.' % (name, name)
+    return lookup
+
+
+getpwnam = _bind('getpwnam', headers.PasswdStruct)
+getpwuid = _bind('getpwuid', headers.PasswdStruct)
+getgrnam = _bind('getgrnam', headers.GroupStruct)
+getgrgid = _bind('getgrgid', headers.GroupStruct)
+getspnam = _bind('getspnam', headers.ShadowStruct)
+gethostbyaddr = _bind('gethostbyaddr', headers.HostStruct, herrno=True)
+gethostbyname2 = _bind('gethostbyname2', headers.HostStruct, herrno=True)
+getnetbyname = _bind('getnetbyname', headers.NetworkStruct, herrno=True)
+getprotobyname = _bind('getprotobyname', headers.ProtoStruct)
+getprotobynumber = _bind('getprotobynumber', headers.ProtoStruct)
+getrpcbyname = _bind('getrpcbyname', headers.RPCStruct)
+getrpcbynumber = _bind('getrpcbynumber', headers.RPCStruct)
+getservbyname = _bind('getservbyname', headers.ServiceStruct)
+getservbyport = _bind('getservbyport', headers.ServiceStruct)
@@ -0,0 +1,411 @@
+"""Batched asynchronous host resolution for the getent package.
+
+:func:`getent.host` resolves one name at a time, and may need several
+blocking lookups to do so. :func:`resolve_many` instead submits batches of
+names to glibc's ``getaddrinfo_a``, which resolves them concurrently, and
+waits for the whole batch at once::
+
+    >>> from getent.resolver import resolve_many
+    >>> hosts = resolve_many(['localhost', 'example.org'], timeout=2.0)
+    >>> print hosts['localhost'].addresses
+    ['127.0.0.1']
+
+Names that could not be resolved, or not within the timeout, map to
+``None``. This needs glibc, on other platforms :func:`available` returns
+``False`` and :func:`resolve_many` raises :class:`NotImplementedError`.
+
+:func:`lookup` resolves a single name to its IPv4 and IPv6 addresses in one
+``getaddrinfo`` call. The addresses are kept packed, and only formatted
+when they are accessed::
+
+    >>> from getent.resolver import lookup
+    >>> print lookup('localhost').addresses
+    ('::1', '127.0.0.1')
+
+By default only the families the host has an address of itself are asked
+for (``AI_ADDRCONFIG``), so on a host without IPv6 addresses this is
+``('127.0.0.1',)``.
+
+:func:`reverse_many` looks up the host names of many addresses, such as all
+source addresses in a log file, concurrently and through a cache::
+
+    >>> from getent.resolver import reverse_many
+    >>> print reverse_many(['127.0.0.1', '127.0.0.1'])['127.0.0.1'].name
+    localhost
+
+"""
+
+import socket
+import threading
+import time
+from ctypes import POINTER, addressof, byref, pointer, string_at
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from getent import Host, HostAddresses, convert23
+from getent import reentrant as _reentrant
+from getent.cache import MISSING, TTLCache
+from getent.constants import (
+    AF_INET,
+    AF_INET6,
+    AF_UNSPEC,
+    AI_ADDRCONFIG,
+    AI_CANONNAME,
+    EAI_INPROGRESS,
+    EAI_NOTCANCELED,
+    GAI_NOWAIT,
+    IN6ADDRSZ,
+    INADDRSZ,
+    SOCK_STREAM,
+    c_char_p,
+)
+from getent.headers import AddrInfoStruct, GaicbStruct
+from getent.headers import SockAddrIn6Struct, SockAddrInStruct, TimespecStruct
+from getent.libc import (
+    freeaddrinfo,
+    gai_cancel,
+    gai_error,
+    gai_strerror,
+    gai_suspend,
+    getaddrinfo,
+    getaddrinfo_a,
+)
+
+__all__ = ('available', 'lookup', 'resolve_many', 'reverse_many')
+
+#: Number of names submitted to ``getaddrinfo_a`` at once
+BATCH_SIZE = 256
+
+#: Number of threads used by :func:`reverse_many`
+REVERSE_WORKERS = 32
+
+#: Default cache of :func:`reverse_many`, addresses without a name included
+reverse_cache = TTLCache(ttl=300, negative_ttl=60, maxsize=1 << 16,
+                         name='reverse')
+
+# Requests that could not be cancelled after a timeout. libc still writes to
+# them, so they are kept alive until they complete.
+_abandoned = []
+_lock = threading.Lock()
+
+
+def available():
+    """Whether batched resolution is available on this platform."""
+    return bool(getaddrinfo_a)
+
+
+class _Batch(object):
+
+    """One batch of ``getaddrinfo_a`` requests, and the memory it uses."""
+
+    def __init__(self, names, family):
+        self.names = names
+        self.hints = AddrInfoStruct()
+        self.hints.flags = AI_CANONNAME
+        self.hints.family = family
+        self.hints.socktype = SOCK_STREAM
+        self.keys = [c_char_p(name) for name in names]
+        self.requests = (GaicbStruct * len(names))()
+        for request, key in zip(self.requests, self.keys):
+            request.name = key
+            request.request = pointer(self.hints)
+        self.pointers = [pointer(request) for request in self.requests]
+
+    def submit(self):
+        """Submit all requests without waiting for them."""
+        items = (POINTER(GaicbStruct) * len(self.pointers))(*self.pointers)
+        err = getaddrinfo_a(GAI_NOWAIT, items, len(self.pointers), None)
+        if err:
+            raise socket.gaierror(err, gai_strerror(err))
+
+    def wait(self, deadline):
+        """Wait for the requests until `deadline`, return unfinished ones."""
+        pending = list(range(len(self.pointers)))
+        while True:
+            pending = [i for i in pending
+                       if gai_error(self.pointers[i]) == EAI_INPROGRESS]
+            if not pending:
+                return pending
+
+            timeout = None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return pending
+                timeout = TimespecStruct(
+                    int(remaining), int(remaining % 1 * 1e9))
+
+            items = (POINTER(GaicbStruct) * len(pending))(
+                *[self.pointers[i] for i in pending])
+            gai_suspend(items, len(pending),
+                        byref(timeout) if timeout is not None else None)
+
+    def cancel(self, pending):
+        """Cancel `pending` requests, return whether all were cancelled."""
+        done = True
+        for i in pending:
+            if gai_cancel(self.pointers[i]) == EAI_NOTCANCELED:
+                done = False
+        return done
+
+    def finished(self):
+        """Whether libc is done with all requests."""
+        return all(gai_error(p) != EAI_INPROGRESS for p in self.pointers)
+
+    def results(self):
+        """Collect the results as ``name: Host`` pairs, and free them."""
+        for name, request in zip(self.names, self.requests):
+            if gai_error(pointer(request)) or not request.result:
+                yield name, None
+                continue
+
+            try:
+                yield name, _host(name, request.result)
+            finally:
+                freeaddrinfo(request.result)
+                request.result = None
+
+    def free(self):
+        """Free all results."""
+        for request in self.requests:
+            if request.result:
+                freeaddrinfo(request.result)
+                request.result = None
+
+
+def _addresses(info):
+    """Yield ``(family, packed address)`` for an ``addrinfo`` chain."""
+    while info:
+        ent = info.contents
+        if ent.family == AF_INET:
+            addr = SockAddrInStruct.from_address(addressof(ent.addr.contents))
+            yield ent.family, string_at(addressof(addr.addr), INADDRSZ)
+        else:
+            addr = SockAddrIn6Struct.from_address(addressof(ent.addr.contents))
+            yield ent.family, string_at(addressof(addr.addr), IN6ADDRSZ)
+        info = ent.next
+
+
+def _host(name, info):
+    """Build a :class:`getent.Host` from an ``addrinfo`` chain.
+
+    A :class:`getent.Host` has a single address type, so only the addresses
+    of the family the resolver preferred (the first result) are kept.
+    """
+    addresses = []
+    for family, packed in _addresses(info):
+        if family == info.contents.family:
+            address = socket.inet_ntop(family, packed)
+            if address not in addresses:
+                addresses.append(address)
+
+    canonname = convert23(info.contents.canonname) or name
+    return Host._make((canonname, (), info.contents.family, tuple(addresses)))
+
+
+def lookup(name, family=AF_UNSPEC, flags=AI_ADDRCONFIG):
+    """Resolve `name` to the addresses of all families in one pass.
+
+    :param family: address family to ask for, ``AF_UNSPEC`` for any
+    :param flags: ``getaddrinfo`` flags, by default only families the host
+                  has an address of itself are asked for
+
+    Returns a :class:`getent.HostAddresses`, or ``None`` if the name could
+    not be resolved.
+    """
+    hints = AddrInfoStruct()
+    hints.flags = flags | AI_CANONNAME
+    hints.family = family
+    hints.socktype = SOCK_STREAM
+    result = POINTER(AddrInfoStruct)()
+    if getaddrinfo(c_char_p(name), None, byref(hints), byref(result)):
+        return None
+
+    try:
+        packed = []
+        for address in _addresses(result):
+            if address not in packed:
+                packed.append(address)
+
+        canonname = convert23(result.contents.canonname) or name
+        return HostAddresses._make((canonname, tuple(packed)))
+    finally:
+        freeaddrinfo(result)
+
+
+def _reap():
+    """Free abandoned requests that libc has finished with."""
+    with _lock:
+        for batch in list(_abandoned):
+            if batch.finished():
+                batch.free()
+                _abandoned.remove(batch)
+
+
+def resolve_many(names, timeout=None, family=AF_UNSPEC, batch_size=None):
+    """Resolve many host names concurrently.
+
+    :param names: iterable of host names, duplicates are resolved once
+    :param timeout: seconds to wait for each batch, ``None`` waits forever
+    :param family: address family to ask for, ``AF_UNSPEC`` for any
+    :param batch_size: names per batch, defaults to :data:`BATCH_SIZE`
+
+    Returns a mapping of each name to a :class:`getent.Host`, or ``None``.
+    """
+    if not available():
+        raise NotImplementedError('getaddrinfo_a is not available')
+
+    _reap()
+    names = list(set(names))
+    batch_size = batch_size or BATCH_SIZE
+    hosts = {}
+    for offset in range(0, len(names), batch_size):
+        batch = _Batch(names[offset:offset + batch_size], family)
+        batch.submit()
+        deadline = time.time() + timeout if timeout is not None else None
+        pending = batch.wait(deadline)
+        if pending and not batch.cancel(pending):
+            # Requests that could not be cancelled still run in the
+            # background, leave them to libc and collect what is ready.
+            with _lock:
+                _abandoned.append(batch)
+
+        hosts.update(batch.results())
+
+    return hosts
+
+
+def _packed(address):
+    """Parse `address` to ``(family, packed)``, ``None`` if invalid."""
+    for family in (AF_INET, AF_INET6):
+        try:
+            return family, socket.inet_pton(family, address)
+        except (socket.error, ValueError):
+            pass
+
+
+def _reverse(key):
+    family, packed = key
+    ent = _reentrant.gethostbyaddr(packed, len(packed), family)
+    return Host(ent) if ent else None
+
+
+def _reverse_all(keys, timeout, workers, cache):
+    """Look up `keys` on `workers` threads, returns ``key: Host`` pairs.
+
+    Lookups that take longer than `timeout` are given up on and map to
+    ``None``, and another thread takes over the remaining work. The threads
+    of the given up lookups keep running until libc returns, and still
+    cache what they find. If ``gethostbyaddr`` is not reentrant, a single
+    thread does all lookups, and the remaining work waits for it.
+    """
+    work = queue.Queue()
+    for key in keys:
+        work.put(key)
+    done = queue.Queue()
+    running = {}
+
+    def worker():
+        while True:
+            try:
+                key = work.get_nowait()
+            except queue.Empty:
+                return
+
+            running[key] = time.time()
+            try:
+                res = _reverse(key)
+            except Exception as error:
+                done.put((key, None, error))
+            else:
+                if cache is not None:
+                    cache.put(key, res)
+                done.put((key, res, None))
+            finally:
+                running.pop(key, None)
+
+    def start():
+        thread = threading.Thread(target=worker, name='getent-reverse')
+        thread.daemon = True
+        thread.start()
+
+    # A second thread would overwrite the static result of the lookup
+    # that is still running
+    reentrant = _reentrant.available('gethostbyaddr')
+    if not reentrant:
+        workers = 1
+    for _ in range(min(workers, len(keys))):
+        start()
+
+    hosts = {}
+    remaining = set(keys)
+    while remaining:
+        wait = None
+        if timeout is not None:
+            now = time.time()
+            deadlines = [(began + timeout, key)
+                         for key, began in list(running.items())
+                         if key in remaining]
+            for deadline, key in deadlines:
+                if deadline <= now:
+                    remaining.discard(key)
+                    hosts[key] = None
+                    if reentrant and not work.empty():
+                        start()
+            if not remaining:
+                break
+            wait = min([deadline - now for deadline, key in deadlines
+                        if deadline > now] or [timeout])
+
+        try:
+            key, res, error = done.get(timeout=wait)
+        except queue.Empty:
+            continue
+        if error is not None:
+            raise error
+        if key in remaining:
+            remaining.discard(key)
+            hosts[key] = res
+
+    return hosts
+
+
+def reverse_many(addresses, timeout=None, workers=None, cache=reverse_cache):
+    """Look up the host names of many addresses concurrently.
+
+    :param addresses: iterable of IPv4 and IPv6 addresses, every distinct
+                      address is looked up once
+    :param timeout: seconds to wait for each address, ``None`` waits
+                    forever
+    :param workers: number of threads, defaults to :data:`REVERSE_WORKERS`
+    :param cache: :class:`getent.cache.TTLCache` to consult and fill,
+                  defaults to :data:`reverse_cache`, ``None`` for none
+
+    Returns a mapping of each address to a :class:`getent.Host`, or
+    ``None`` if the address is invalid, has no name, or did not resolve in
+    time. Addresses without a name are cached too, timeouts are not.
+    """
+    parsed = {}
+    for address in addresses:
+        if address not in parsed:
+            parsed[address] = _packed(address)
+
+    hosts = {}
+    todo = []
+    for key in set(parsed.values()):
+        if key is None:
+            continue
+        res = cache.get(key) if cache is not None else MISSING
+        if res is MISSING:
+            todo.append(key)
+        else:
+            hosts[key] = res
+
+    if todo:
+        hosts.update(_reverse_all(todo, timeout, workers or REVERSE_WORKERS,
+                                  cache))
+
+    return dict((address, hosts.get(key)) for address, key in parsed.items())
@@ -0,0 +1,266 @@
+"""In-memory snapshot of the passwd and group databases.
+
+A :class:`Snapshot` enumerates the passwd and group databases once and
+indexes them, after which lookups by name or id are plain dictionary hits::
+
+    >>> snapshot = getent.Snapshot()
+    >>> print snapshot.passwd(0).name
+    root
+    >>> [g.name for g in snapshot.groups('root')]
+    ['root']
+
+The snapshot checks if it is still fresh at most once every `check`
+seconds: a database is enumerated again if one of its source files changed,
+or, if an `interval` is given, when it is older than that. Only the
+databases that changed are rebuilt.
+
+To translate many ids at once, such as the owners of all files found by a
+filesystem scan, pass a list, an :class:`array.array` or a NumPy array to
+:meth:`Snapshot.usernames` or :meth:`Snapshot.groupnames`. Every distinct id
+is translated once, and ids that are not in the snapshot are looked up
+one by one::
+
+    >>> snapshot.usernames(array.array('I', [0, 0, 1]))
+    ['root', 'root', 'daemon']
+    >>> snapshot.user_codes([0, 0, 1])
+    (['daemon', 'root'], array('i', [1, 1, 0]))
+
+"""
+
+import array
+import threading
+import time
+
+from getent.arrays import is_ndarray, numpy, take
+from getent.files import file_version
+
+__all__ = ('Snapshot',)
+
+#: Files that back each database when nsswitch uses ``files``
+PATHS = {
+    'passwd': ('/etc/passwd',),
+    'group': ('/etc/group',),
+}
+
+
+class Snapshot(object):
+
+    """Indexed snapshot of the passwd and group databases.
+
+    :param source: object with ``passwd()`` and ``group()`` enumeration
+                   functions, defaults to the :mod:`getent` module; a
+                   :class:`getent.files.Files` instance works too
+    :param paths: mapping of database name to the files whose modification
+                  marks the database as changed, defaults to :data:`PATHS`
+    :param interval: seconds after which a database is rebuilt regardless
+                     of its files, ``None`` to only watch the files
+    :param check: seconds between freshness checks on lookup, ``None`` to
+                  only refresh when :meth:`refresh` is called
+    """
+
+    def __init__(self, source=None, paths=None, interval=None, check=1.0):
+        if source is None:
+            import getent as source
+        self.source = source
+        self.paths = PATHS if paths is None else paths
+        self.interval = interval
+        self.check = check
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._built = {}
+        self._extra = {'passwd': {}, 'group': {}}
+        self._next_check = 0
+        self.refresh(force=True)
+
+    def stale(self, database):
+        """Whether `database` needs to be enumerated again."""
+        if database not in self._built:
+            return True
+        if (self.interval is not None and
+                time.time() - self._built[database] >= self.interval):
+            return True
+        return self._version(database) != self._versions[database]
+
+    def _version(self, database):
+        return tuple(file_version(path)
+                     for path in self.paths.get(database, ()))
+
+    def refresh(self, force=False):
+        """Rebuild the databases that changed, or all if `force` is set.
+
+        Returns the names of the rebuilt databases.
+        """
+        with self._lock:
+            rebuilt = [db for db in ('passwd', 'group')
+                       if force or self.stale(db)]
+            for database in rebuilt:
+                # Take the version first, so changes made while enumerating
+                # are picked up by the next check.
+                version = self._version(database)
+                getattr(self, '_build_' + database)()
+                self._extra[database] = {}
+                self._versions[database] = version
+                self._built[database] = time.time()
+
+            if rebuilt:
+                self._build_members()
+            if self.check is not None:
+                self._next_check = time.time() + self.check
+            return rebuilt
+
+    def _build_passwd(self):
+        by_uid, by_name = {}, {}
+        for record in self.source.passwd():
+            by_uid.setdefault(record.uid, record)
+            by_name.setdefault(record.name, record)
+        self._users = (by_uid, by_name)
+
+    def _build_group(self):
+        by_gid, by_name = {}, {}
+        for record in self.source.group():
+            by_gid.setdefault(record.gid, record)
+            by_name.setdefault(record.name, record)
+        self._groups = (by_gid, by_name)
+
+    def _build_members(self):
+        """Build the user name to group ids reverse index."""
+        members = {}
+        for name, user in self._users[1].items():
+            members[name] = [user.gid]
+        for gid, group in self._groups[0].items():
+            for name in group.members:
+                gids = members.setdefault(name, [])
+                if gid not in gids:
+                    gids.append(gid)
+        self._members = dict(
+            (name, tuple(gids)) for name, gids in members.items())
+
+    def _fresh(self):
+        if self.check is not None and time.time() >= self._next_check:
+            self.refresh()
+
+    def passwd(self, search):
+        """Lookup a user by uid or name, ``None`` if it does not exist."""
+        self._fresh()
+        by_uid, by_name = self._users
+        if isinstance(search, int) or str(search).isdigit():
+            return by_uid.get(int(search))
+        return by_name.get(search)
+
+    def group(self, search):
+        """Lookup a group by gid or name, ``None`` if it does not exist."""
+        self._fresh()
+        by_gid, by_name = self._groups
+        if isinstance(search, int) or str(search).isdigit():
+            return by_gid.get(int(search))
+        return by_name.get(search)
+
+    def username(self, uid, default=None):
+        """Translate a uid to a user name."""
+        self._fresh()
+        user = self._users[0].get(uid)
+        return user.name if user is not None else default
+
+    def groupname(self, gid, default=None):
+        """Translate a gid to a group name."""
+        self._fresh()
+        group = self._groups[0].get(gid)
+        return group.name if group is not None else default
+
+    def gids(self, user):
+        """Ids of the primary and supplementary groups of user name `user`."""
+        self._fresh()
+        return self._members.get(user, ())
+
+    def groups(self, user):
+        """Primary and supplementary groups of user name `user`."""
+        by_gid = self._groups[0]
+        return [by_gid[gid] for gid in self.gids(user) if gid in by_gid]
+
+    def users(self):
+        """All users in the snapshot."""
+        self._fresh()
+        return list(self._users[1].values())
+
+    def _translate(self, database, ids):
+        """Map the distinct `ids` to names, ``None`` for unknown ids.
+
+        Ids that are not in the snapshot are looked up in the source, once
+        until the database is rebuilt.
+        """
+        self._fresh()
+        index = (self._users if database == 'passwd' else self._groups)[0]
+        extra = self._extra[database]
+        names = {}
+        for id_ in ids:
+            record = index.get(id_)
+            if record is None:
+                if id_ not in extra:
+                    extra[id_] = getattr(self.source, database)(int(id_))
+                record = extra[id_]
+            names[id_] = record.name if record is not None else None
+        return names
+
+    def _names(self, database, ids, default):
+        if is_ndarray(ids):
+            np = numpy()
+            unique, inverse = np.unique(ids, return_inverse=True)
+            names = self._translate(database, unique.tolist())
+            table = np.array([names[id_] for id_ in unique.tolist()],
+                             dtype=object)
+            if default is not None:
+                table[np.equal(table, None)] = default
+            return table[inverse]
+
+        ids = list(ids)
+        names = self._translate(database, set(ids))
+        if default is not None:
+            for id_, name in names.items():
+                if name is None:
+                    names[id_] = default
+        return take(names, ids)
+
+    def _codes(self, database, ids):
+        np = numpy() if is_ndarray(ids) else None
+        if np is not None:
+            unique, inverse = np.unique(ids, return_inverse=True)
+            names = self._translate(database, unique.tolist())
+        else:
+            ids = list(ids)
+            names = self._translate(database, set(ids))
+
+        table = sorted(set(name for name in names.values() if name))
+        index = dict((name, code) for code, name in enumerate(table))
+        codes = dict((id_, index.get(name, -1)) for id_, name in names.items())
+
+        if np is not None:
+            lookup = np.array([codes[id_] for id_ in unique.tolist()],
+                              dtype=np.int32)
+            return table, lookup[inverse]
+        return table, array.array('i', take(codes, ids))
+
+    def usernames(self, uids, default=None):
+        """Translate many uids to user names at once.
+
+        Returns a list, or a NumPy array of objects if `uids` is a NumPy
+        array. Unknown uids map to `default`.
+        """
+        return self._names('passwd', uids, default)
+
+    def groupnames(self, gids, default=None):
+        """Like :meth:`usernames`, for gids and group names."""
+        return self._names('group', gids, default)
+
+    def user_codes(self, uids):
+        """Translate many uids to codes into a table of user names.
+
+        Returns ``(names, codes)``: the sorted distinct user names, and for
+        every uid the index of its name in it, or ``-1`` for unknown uids.
+        The codes are an :class:`array.array`, or a NumPy array if `uids`
+        is a NumPy array.
+        """
+        return self._codes('passwd', uids)
+
+    def group_codes(self, gids):
+        """Like :meth:`user_codes`, for gids and group names."""
+        return self._codes('group', gids)
@@ -0,0 +1,416 @@
+"""Persistent, memory mapped snapshots for the getent package.
+
+Short lived processes pay the full cost of enumerating NSS on every start.
+:func:`write` enumerates the passwd, group, services and hosts databases
+once and saves them to a compact binary file, which other processes open
+with :class:`Store` and query in place, through a read-only memory map::
+
+    >>> from getent import store
+    >>> store.write('/var/cache/getent.db')
+    >>> snapshot = store.Store('/var/cache/getent.db')
+    >>> print snapshot.passwd(0).name
+    root
+
+:func:`load` combines the two, and writes the file again when it is
+missing or stale. A file is stale when one of the source files of its
+databases changed, or when it was written with another `generation` than
+the caller expects; bump the generation to invalidate the snapshots of
+databases that are not backed by files.
+
+A file starts with a header and a directory of tables. Every database has
+a table of fixed-width rows, in which integers are stored as is and
+strings as an offset and length into a shared string blob, and a sorted
+index table per lookup key. Lookups are a binary search over an index
+followed by decoding a single row, nothing is parsed up front.
+"""
+
+import mmap
+import os
+import socket
+import struct
+import tempfile
+
+from getent import Group, Host, Passwd, Service, convert23
+from getent.files import file_version
+
+__all__ = ('DATABASES', 'Store', 'load', 'write')
+
+#: Databases written by default
+DATABASES = ('passwd', 'group', 'services', 'hosts')
+
+#: Files whose modification makes the snapshot of a database stale
+SOURCES = {
+    'passwd': ('/etc/passwd',),
+    'group': ('/etc/group',),
+    'services': ('/etc/services',),
+    'hosts': ('/etc/hosts',),
+}
+
+MAGIC = b'GETENTDB'
+VERSION = 1
+
+# magic, version, number of tables, generation
+_HEADER = struct.Struct('<8sIIQ')
+# table name, offset, number of entries
+_TABLE = struct.Struct('<32sQQ')
+# index entries, key and row
+_INT_ENTRY = struct.Struct('<qI')
+_STR_ENTRY = struct.Struct('<III')
+# source path, modification time, size and inode
+_SOURCE = struct.Struct('<IIdqq')
+# Version stored for a source file that does not exist
+_MISSING = (0.0, -1, -1)
+
+
+def _lower(values):
+    return [value.lower() for value in values]
+
+
+# Per database: record class, the layout of its fields (s for a string, t
+# for a tuple of strings and q for an integer), the enumeration function
+# and the indexes, as name, key kind and a function that returns the keys
+# of a record.
+_SCHEMAS = {
+    'passwd': (Passwd, 'ssqqsss', 'passwd', (
+        ('name', 's', lambda r: [r.name]),
+        ('uid', 'q', lambda r: [r.uid]),
+    )),
+    'group': (Group, 'ssqt', 'group', (
+        ('name', 's', lambda r: [r.name]),
+        ('gid', 'q', lambda r: [r.gid]),
+    )),
+    'services': (Service, 'stqs', 'service', (
+        ('name', 's', lambda r: [r.name] + list(r.aliases)),
+        ('port', 'q', lambda r: [r.port]),
+    )),
+    'hosts': (Host, 'stqt', 'host', (
+        ('name', 's', lambda r: _lower([r.name] + list(r.aliases))),
+        ('address', 's', lambda r: list(r.addresses)),
+    )),
+}
+
+
+def _encode(value):
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def _row(layout):
+    return struct.Struct('<' + ''.join(
+        'q' if kind == 'q' else 'II' for kind in layout))
+
+
+class _Blob(object):
+
+    """String blob that stores every distinct string once."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+
+    def add(self, value):
+        """Add string `value`, returns its offset and length."""
+        value = _encode(value)
+        ref = self.offsets.get(value)
+        if ref is None:
+            ref = self.offsets[value] = (len(self.data), len(value))
+            self.data += value
+        return ref
+
+
+def _tables(database, source, paths, blob):
+    """Build the tables of `database`, as ``(name, count, data)``."""
+    cls, layout, function, indexes = _SCHEMAS[database]
+
+    # Take the versions first, so changes made while enumerating make the
+    # snapshot stale.
+    sources = bytearray()
+    for path in paths:
+        sources += _SOURCE.pack(*(blob.add(path) +
+                                  (file_version(path) or _MISSING)))
+    yield database + ':sources', len(paths), sources
+
+    records = getattr(source, function)()
+    row = _row(layout)
+    rows = bytearray()
+    for record in records:
+        values = []
+        for kind, value in zip(layout, record._values()):
+            if kind == 'q':
+                values.append(value)
+            elif kind == 't':
+                values.extend(blob.add('\0'.join(value)))
+            else:
+                values.extend(blob.add(value))
+        rows += row.pack(*values)
+    yield database, len(records), rows
+
+    for name, kind, keys in indexes:
+        entries = [(key, number)
+                   for number, record in enumerate(records)
+                   for key in keys(record)]
+        data = bytearray()
+        if kind == 'q':
+            for key, number in sorted(entries):
+                data += _INT_ENTRY.pack(key, number)
+        else:
+            for key, number in sorted(
+                    (_encode(key), number) for key, number in entries):
+                data += _STR_ENTRY.pack(*(blob.add(key) + (number,)))
+        yield '%s:%s' % (database, name), len(entries), data
+
+
+def write(path, databases=None, source=None, generation=0, sources=None):
+    """Write a snapshot of `databases` to `path`.
+
+    :param databases: names of the databases, defaults to :data:`DATABASES`
+    :param source: object with the enumeration functions, defaults to the
+                   :mod:`getent` module; a :class:`getent.files.Files`
+                   instance works too
+    :param generation: generation counter stored in the file
+    :param sources: mapping of database name to the files whose
+                    modification makes it stale, defaults to
+                    :data:`SOURCES`
+
+    The file is replaced atomically, processes that have the previous
+    snapshot open keep using it.
+    """
+    if source is None:
+        import getent as source
+    sources = SOURCES if sources is None else sources
+
+    blob = _Blob()
+    tables = []
+    for database in databases or DATABASES:
+        tables.extend(_tables(database, source, sources.get(database, ()),
+                              blob))
+    tables.append(('strings', len(blob.data), blob.data))
+
+    offset = _HEADER.size + _TABLE.size * len(tables)
+    parts = [_HEADER.pack(MAGIC, VERSION, len(tables), generation)]
+    for name, count, data in tables:
+        parts.append(_TABLE.pack(name.encode('ascii'), offset, count))
+        offset += len(data)
+    parts.extend(bytes(data) for _, _, data in tables)
+
+    fd, temp = tempfile.mkstemp(prefix='.getent', dir=os.path.dirname(
+        os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(b''.join(parts))
+        os.chmod(temp, 0o644)
+        os.rename(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+class Store(object):
+
+    """Read-only view of a snapshot written by :func:`write`.
+
+    Lookups behave like those of :class:`getent.files.Files`. Looking up a
+    database that is not in the file raises :class:`KeyError`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, count, self.generation = _HEADER.unpack_from(
+                self._data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('%s is not a getent snapshot' % (path,))
+
+            self._tables = {}
+            for number in range(count):
+                name, offset, size = _TABLE.unpack_from(
+                    self._data, _HEADER.size + _TABLE.size * number)
+                name = name.rstrip(b'\0').decode('ascii')
+                self._tables[name] = (offset, size)
+        except (ValueError, struct.error):
+            self._data.close()
+            raise ValueError('%s is not a getent snapshot' % (path,))
+
+        self._strings = self._tables['strings'][0]
+
+    def close(self):
+        """Unmap the file."""
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def databases(self):
+        """Names of the databases in the snapshot."""
+        return [name for name in DATABASES if name in self._tables]
+
+    def stale(self, generation=None):
+        """Whether the snapshot is out of date.
+
+        It is if a source file changed, or if a `generation` is given and
+        the snapshot was written with another one.
+        """
+        if generation is not None and generation != self.generation:
+            return True
+
+        for database in self.databases:
+            offset, count = self._tables[database + ':sources']
+            for number in range(count):
+                path_offset, length, mtime, size, ino = _SOURCE.unpack_from(
+                    self._data, offset + _SOURCE.size * number)
+                path = self._string(path_offset, length)
+                if (file_version(path) or _MISSING) != (mtime, size, ino):
+                    return True
+        return False
+
+    def _bytes(self, offset, length):
+        start = self._strings + offset
+        return self._data[start:start + length]
+
+    def _string(self, offset, length):
+        return convert23(self._bytes(offset, length))
+
+    def _table(self, name):
+        try:
+            return self._tables[name]
+        except KeyError:
+            raise KeyError('%s is not in %s' % (name, self.path))
+
+    def _record(self, database, number):
+        cls, layout, _, _ = _SCHEMAS[database]
+        offset, _ = self._tables[database]
+        row = _row(layout)
+        packed = iter(row.unpack_from(self._data, offset + row.size * number))
+        values = []
+        for kind in layout:
+            if kind == 'q':
+                values.append(next(packed))
+                continue
+
+            value = self._string(next(packed), next(packed))
+            if kind == 't':
+                value = tuple(value.split('\0')) if value else ()
+            values.append(value)
+        return cls._make(values)
+
+    def _all(self, database):
+        _, count = self._table(database)
+        return [self._record(database, number) for number in range(count)]
+
+    def _find(self, database, index, key):
+        """Yield the rows of `database` that have `key` in `index`."""
+        self._table(database)
+        offset, count = self._tables['%s:%s' % (database, index)]
+        kinds = dict((name, kind) for name, kind, _ in _SCHEMAS[database][3])
+        if kinds[index] == 'q':
+            entry = _INT_ENTRY
+
+            def key_at(number):
+                return entry.unpack_from(self._data, offset +
+                                         entry.size * number)[0]
+        else:
+            entry = _STR_ENTRY
+            key = _encode(key)
+
+            def key_at(number):
+                return self._bytes(*entry.unpack_from(
+                    self._data, offset + entry.size * number)[:2])
+
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        while low < count and key_at(low) == key:
+            yield entry.unpack_from(self._data,
+                                    offset + entry.size * low)[-1]
+            low += 1
+
+    def _first(self, database, index, key):
+        for number in self._find(database, index, key):
+            return self._record(database, number)
+
+    def passwd(self, search=None):
+        """Perform a passwd lookup, see :func:`getent.passwd`."""
+        if search is None:
+            return self._all('passwd')
+
+        search = str(search)
+        if search.isdigit():
+            return self._first('passwd', 'uid', int(search))
+        return self._first('passwd', 'name', search)
+
+    def group(self, search=None):
+        """Perform a group lookup, see :func:`getent.group`."""
+        if search is None:
+            return self._all('group')
+
+        search = str(search)
+        if search.isdigit():
+            return self._first('group', 'gid', int(search))
+        return self._first('group', 'name', search)
+
+    def service(self, search=None, protocol=None):
+        """Perform a service lookup, see :func:`getent.service`."""
+        if search is None:
+            return self._all('services')
+
+        search = str(search)
+        if not protocol and '/' in search:
+            protocol, search = search.split('/')
+
+        if search.isdigit():
+            rows = self._find('services', 'port', int(search))
+        else:
+            rows = self._find('services', 'name', search)
+        for number in sorted(rows):
+            record = self._record('services', number)
+            if not protocol or record.proto == protocol:
+                return record
+
+    def host(self, search=None):
+        """Perform a host lookup, see :func:`getent.host`."""
+        if search is None:
+            return self._all('hosts')
+
+        search = str(search)
+        for family in (socket.AF_INET6, socket.AF_INET):
+            try:
+                address = socket.inet_ntop(
+                    family, socket.inet_pton(family, search))
+            except (socket.error, ValueError):
+                continue
+            return self._first('hosts', 'address', address)
+
+        return self._first('hosts', 'name', search.lower())
+
+
+def load(path, generation=None, databases=None, source=None):
+    """Open the snapshot at `path`, writing it first if needed.
+
+    The snapshot is written again if it is missing, unreadable or
+    :meth:`Store.stale`. Returns a :class:`Store`.
+    """
+    try:
+        store = Store(path)
+    except (IOError, OSError, ValueError):
+        store = None
+    else:
+        if store.stale(generation) or (
+                databases and not set(databases) <= set(store.databases)):
+            store.close()
+            store = None
+
+    if store is None:
+        write(path, databases, source, generation or 0)
+        store = Store(path)
+    return store
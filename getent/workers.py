@@ -0,0 +1,302 @@
+"""Lookups in isolated worker processes, with hard deadlines.
+
+The ``set*ent``/``get*ent`` cursors of the C library are global to the
+process, and NSS modules may block for as long as their servers take to
+answer. A :class:`WorkerPool` runs lookups and enumerations in forked
+worker processes instead, so a hung backend only stalls a worker, which is
+killed and replaced once the deadline of the call passes::
+
+    >>> from getent.workers import WorkerPool
+    >>> with WorkerPool(timeout=5) as pool:
+    ...     root = pool.call('passwd', 'root')
+    ...     for user in pool.enumerate('passwd'):
+    ...         print user.name
+    root
+    daemon
+    ...
+
+A call that does not finish in time raises :class:`getent.Timeout`.
+Enumerations are streamed back in batches of plain value tuples, and
+several databases can be enumerated at once, each by its own worker and so
+on its own core::
+
+    >>> databases = pool.enumerate_many(['passwd', 'group', 'host'])
+    >>> len(databases['group'])
+    42
+
+The workers are forked when the pool is created, and when one is replaced.
+Forking a process that runs other threads is fragile, so create the pool
+early.
+"""
+
+import multiprocessing
+import os
+import select
+import signal
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import getent
+
+__all__ = ('BATCH_SIZE', 'DATABASES', 'WorkerPool')
+
+#: Number of records sent back per batch by an enumeration
+BATCH_SIZE = 512
+
+#: Databases that can be enumerated
+DATABASES = ('alias', 'group', 'host', 'network', 'passwd', 'proto', 'rpc',
+             'service', 'shadow')
+
+
+def _context():
+    """Get a multiprocessing context that forks, if there are contexts."""
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing
+
+
+def _send_error(conn, error):
+    try:
+        conn.send(('error', error))
+    except Exception:  # The exception can not be pickled
+        conn.send(('error', RuntimeError(repr(error))))
+
+
+def _serve(conn):
+    """Answer requests from `conn` until it is closed."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if not hasattr(os, 'register_at_fork'):
+        getent._after_fork()  # pylint: disable=protected-access
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, IOError, OSError):
+            return
+        if request is None:
+            return
+        name, args, kwargs, batch_size = request
+
+        try:
+            function = getattr(getent, name)
+            if not batch_size:
+                conn.send(('done', function(*args, **kwargs)))
+                continue
+
+            # Send the values of the records, with their class once per batch
+            batch = []
+            for record in function(stream=True):
+                batch.append(record._values())
+                if len(batch) == batch_size:
+                    conn.send(('batch', type(record), batch))
+                    batch = []
+            if batch:
+                conn.send(('batch', type(record), batch))
+            conn.send(('done', None))
+        except Exception as error:
+            _send_error(conn, error)
+
+
+class _Worker(object):
+
+    """One worker process and the parent end of its pipe."""
+
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        """Kill the worker, regardless of what it is doing."""
+        try:
+            os.kill(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+    def stop(self, timeout=1.0):
+        """Ask the worker to exit, kill it if it does not in `timeout`."""
+        # Other workers hold copies of our end of the pipe, so closing it
+        # does not tell the worker to exit
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.conn.close()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+
+
+class WorkerPool(object):
+
+    """Pool of forked processes that perform lookups.
+
+    :param size: number of worker processes, defaults to the number of CPUs
+    :param timeout: default deadline of a call in seconds, ``None`` to wait
+                    as long as it takes
+    :param batch_size: number of records sent back per batch by enumerations
+
+    Calls from several threads run in parallel, as long as there are idle
+    workers; waiting for a worker counts towards the deadline of a call.
+    """
+
+    def __init__(self, size=None, timeout=None, batch_size=BATCH_SIZE):
+        self.size = size or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._context = _context()
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.size):
+            self._spawn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _spawn(self):
+        worker = _Worker(self._context)
+        with self._lock:
+            self._workers.add(worker)
+        self._idle.put(worker)
+
+    def _deadline(self, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        return None if timeout is None else time.time() + timeout
+
+    def _acquire(self, deadline):
+        if self._closed:
+            raise ValueError('the worker pool is closed')
+        try:
+            if deadline is None:
+                return self._idle.get()
+            return self._idle.get(timeout=max(0, deadline - time.time()))
+        except queue.Empty:
+            raise getent.Timeout('no idle worker before the deadline')
+
+    def _release(self, worker):
+        self._idle.put(worker)
+
+    def _replace(self, worker):
+        """Kill `worker` and start another one in its place."""
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+        if not self._closed:
+            self._spawn()
+
+    def _receive(self, worker, deadline):
+        """Get the next message of `worker`, waiting until `deadline`."""
+        if deadline is not None:
+            remaining = max(0, deadline - time.time())
+            ready = select.select([worker.conn.fileno()], [], [], remaining)
+            if not ready[0]:
+                raise getent.Timeout('lookup did not finish in time')
+        return worker.conn.recv()
+
+    def call(self, name, *args, **kwargs):
+        """Call lookup function `name` of :mod:`getent` in a worker.
+
+        Takes an extra `timeout` keyword argument, which overrides the
+        default deadline of the pool::
+
+            >>> pool.call('group', 'wheel', timeout=0.5)
+            Group(name='wheel', ...)
+
+        """
+        timeout = kwargs.pop('timeout', None)
+        for kind, value in self._messages((name, args, kwargs, 0), timeout):
+            if kind == 'error':
+                raise value[0]
+            return value[0]
+
+    def _messages(self, request, timeout):
+        """Yield ``(kind, value)`` of all messages for `request`."""
+        deadline = self._deadline(timeout)
+        worker = self._acquire(deadline)
+        done = False
+        try:
+            worker.conn.send(request)
+            while not done:
+                message = self._receive(worker, deadline)
+                done = message[0] != 'batch'
+                yield message[0], message[1:]
+        except (EOFError, IOError, OSError):
+            raise RuntimeError('worker %d died' % (worker.process.pid,))
+        finally:
+            # A worker that timed out or was left halfway an enumeration is
+            # in an unknown state
+            if done:
+                self._release(worker)
+            else:
+                self._replace(worker)
+
+    def enumerate(self, database, timeout=None):
+        """Enumerate all entries of `database`, for example ``'passwd'``.
+
+        Returns a generator. The deadline applies to the enumeration as a
+        whole; if it passes, :class:`getent.Timeout` is raised after the
+        records received so far.
+        """
+        if database not in DATABASES:
+            raise ValueError('Can not enumerate "%s"' % (database,))
+
+        messages = self._messages(
+            (database, (), {}, self.batch_size), timeout)
+        for kind, value in messages:
+            if kind == 'error':
+                raise value[0]
+            elif kind == 'batch':
+                cls, batch = value
+                for values in batch:
+                    yield cls._make(values)
+
+    def enumerate_many(self, databases, timeout=None):
+        """Enumerate several `databases` at once.
+
+        Every database is enumerated by its own worker, as far as there are
+        idle workers. Returns a dict of database name to a list of records.
+        The first error or :class:`getent.Timeout` is raised once all
+        enumerations finished.
+        """
+        results, errors = {}, []
+
+        def run(database):
+            try:
+                results[database] = list(self.enumerate(database, timeout))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=run, args=(database,))
+                   for database in databases]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        return results
+
+    def close(self):
+        """Stop all workers."""
+        self._closed = True
+        with self._lock:
+            workers, self._workers = self._workers, set()
+        for worker in workers:
+            worker.stop()
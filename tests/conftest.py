@@ -0,0 +1,4 @@
+import sys
+
+# getent.aio and its tests need Python 3.6 or later
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 6) else []
@@ -0,0 +1,75 @@
+"""Tests for the asyncio wrappers."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import getent
+from getent import aio
+
+DATABASES = ('passwd', 'group', 'service', 'proto')
+
+
+@pytest.fixture
+def executor():
+    previous = aio.get_executor()
+    executor = ThreadPoolExecutor(4)
+    aio.set_executor(executor)
+    yield executor
+    aio.set_executor(previous)
+    executor.shutdown()
+
+
+def finishes(func, timeout=5):
+    """Run `func` in a thread, and tell if it returned within `timeout`."""
+    thread = threading.Thread(target=func)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_concurrent_streams(executor):
+    async def consume(database):
+        return [record async for record in aio.stream(database, 2)]
+
+    async def main():
+        return await asyncio.gather(*[consume(db) for db in DATABASES])
+
+    results = asyncio.run(main())
+    for database, records in zip(DATABASES, results):
+        assert records == getattr(getent, database)()
+
+    # The cursors were released, whichever threads fetched the batches
+    assert finishes(getent.passwd)
+
+
+def test_cancel_stream_while_fetching(executor, monkeypatch):
+    expected = getent.passwd()
+    getpwent = getent.getpwent
+
+    def slow_getpwent():
+        time.sleep(0.02)
+        return getpwent()
+
+    monkeypatch.setattr(getent, 'getpwent', slow_getpwent)
+
+    async def consume():
+        return [record async for record in aio.stream('passwd', 1000)]
+
+    async def main():
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    monkeypatch.setattr(getent, 'getpwent', getpwent)
+    # The cursor was closed once the batch in flight was done
+    result = []
+    assert finishes(lambda: result.extend(getent.passwd()))
+    assert result == expected
@@ -0,0 +1,43 @@
+"""Tests for the shadow audit, against a shadow file fixture."""
+
+import pytest
+
+from getent.audit import NEVER, ShadowAudit
+from getent.files import Files
+
+TODAY = 19085
+
+
+@pytest.fixture
+def audit(tmpdir):
+    tmpdir.mkdir('etc').join('shadow').write(
+        'root:*:19000:0:99999:7:::\n'
+        'alice:$6$abc:19000:0:90:7:::\n'
+        'bob::19000:0:99999:7:::\n'
+        'carol:!$6$def:18000::::::\n'
+        'dave:$6$ghi:19000:0:30:7:10:19100:\n')
+    return ShadowAudit(Files(str(tmpdir)), today=TODAY)
+
+
+def test_columns(audit):
+    assert len(audit) == 5
+    assert list(audit.age) == [85, 85, 85, 1085, 85]
+    assert list(audit.expires_in) == [99914, 5, 99914, NEVER, -55]
+    assert list(audit.disabled_in) == [NEVER, NEVER, NEVER, NEVER, -45]
+    assert list(audit.account_expires_in) == [NEVER] * 4 + [15]
+
+
+def test_locked_and_empty_passwords(audit):
+    assert audit.locked_accounts() == ['root', 'carol']
+    assert audit.empty_passwords() == ['bob']
+    assert list(audit.locked) == [1, 0, 0, 1, 0]
+    assert list(audit.empty) == [0, 0, 1, 0, 0]
+
+
+def test_filters(audit):
+    assert audit.expiring(14) == ['alice']
+    assert audit.expired() == ['dave']
+    assert audit.account_expiring(30) == ['dave']
+    assert audit.unchanged_for(365) == ['carol']
+    assert audit.warning() == ['alice']
+    assert audit.select('age', 0, 100) == ['root', 'alice', 'bob', 'dave']
@@ -0,0 +1,91 @@
+"""Tests for the lookup cache, with a clock that only moves when told."""
+
+import pytest
+
+import getent
+import getent.cache
+from getent.cache import MISSING, TTLCache
+
+
+class Clock(object):
+
+    """Stand-in for :func:`time.time`, advanced by hand."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_ttl_expiry(clock):
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.put('root', 'record')
+    clock.now += 9.9
+    assert cache.get('root') == 'record'
+    clock.now += 0.1
+    assert cache.get('root') is MISSING
+    assert cache.get('root', None) is None
+
+
+def test_negative_ttl(clock):
+    cache = TTLCache(ttl=10, negative_ttl=2, clock=clock)
+    cache.put('nosuchuser', None)
+    assert cache.get('nosuchuser') is None
+    clock.now += 2
+    assert cache.get('nosuchuser') is MISSING
+
+    cache = TTLCache(ttl=10, negative_ttl=0, clock=clock)
+    cache.put('nosuchuser', None)
+    assert len(cache) == 0
+
+
+def test_lru_eviction(clock):
+    cache = TTLCache(maxsize=2, clock=clock)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # A hit makes 'a' the most recently used, so 'b' is evicted first
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert len(cache) == 2
+    assert cache.get('b') is MISSING
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_invalidate_drops_aliases(clock):
+    cache = TTLCache(clock=clock)
+    cache.put('root', 'record', ('root', 0))
+    cache.put('daemon', 'other', ('daemon', 1))
+    cache.invalidate(0)
+    assert cache.get('root') is MISSING
+    assert cache.get(0) is MISSING
+    assert cache.get(1) == 'other'
+
+
+def test_stale_returns_expired(clock):
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.put('root', 'record')
+    clock.now += 60
+    assert cache.get('root') is MISSING
+    assert cache.stale('root') == 'record'
+    assert cache.stale('daemon') is MISSING
+
+
+def test_name_lookup_warms_id(monkeypatch):
+    getent.cache.enable('passwd')
+    try:
+        root = getent.passwd('root')
+
+        def getpwuid(uid):
+            raise AssertionError('not answered from the cache')
+
+        monkeypatch.setattr(getent, 'getpwuid', getpwuid)
+        assert getent.passwd(0) is root
+        assert getent.passwd('0') is root
+    finally:
+        getent.cache.disable()
@@ -0,0 +1,120 @@
+"""Tests for lookup deadlines, against a deliberately slow NSS source."""
+
+import threading
+import time
+
+import pytest
+
+import getent
+import getent.cache
+
+timer = getattr(time, 'monotonic', time.time)
+
+# Slack for starting the lookup thread and scheduling
+SLACK = 0.25
+
+
+class SlowSource(object):
+
+    """Stand-in for a libc function that takes `delay` seconds."""
+
+    def __init__(self, function, delay=1.0):
+        self.function = function
+        self.delay = delay
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__
+
+    def __call__(self, *args):
+        time.sleep(self.delay)
+        return self.function(*args)
+
+
+@pytest.fixture
+def slow_getpwnam(monkeypatch):
+    source = SlowSource(getent.getpwnam)
+    monkeypatch.setattr(getent, 'getpwnam', source)
+    yield source
+    getent.cache.disable()
+
+
+def test_timeout_raises_within_budget(slow_getpwnam):
+    start = timer()
+    with pytest.raises(getent.Timeout):
+        getent.passwd('root', timeout=0.1)
+    assert 0.1 <= timer() - start < 0.1 + SLACK
+
+
+def test_lookup_within_timeout(slow_getpwnam):
+    slow_getpwnam.delay = 0
+    assert getent.passwd('root', timeout=5).uid == 0
+
+
+def test_nested_deadline_uses_earliest(slow_getpwnam):
+    for outer, inner in ((5, 0.1), (0.1, 5)):
+        start = timer()
+        with getent.deadline(outer):
+            with getent.deadline(inner):
+                with pytest.raises(getent.Timeout):
+                    getent.passwd('root')
+        assert timer() - start < 0.1 + SLACK
+
+
+def test_deadline_with_timeout_uses_earliest(slow_getpwnam):
+    start = timer()
+    with getent.deadline(5):
+        with pytest.raises(getent.Timeout):
+            getent.passwd('root', timeout=0.1)
+    assert timer() - start < 0.1 + SLACK
+
+
+def test_stale_cached_record(slow_getpwnam):
+    getent.cache.enable('passwd', ttl=0.05)
+    slow_getpwnam.delay = 0
+    assert getent.passwd('root').uid == 0
+
+    time.sleep(0.1)
+    slow_getpwnam.delay = 1.0
+    start = timer()
+    root = getent.passwd('root', timeout=0.1)
+    assert root is not None and root.uid == 0
+    assert timer() - start < 0.1 + SLACK
+
+
+def test_timed_out_enumeration_keeps_cursor(monkeypatch):
+    count = len(getent.passwd())
+    monkeypatch.setattr(getent, 'getpwent',
+                        SlowSource(getent.getpwent, delay=0.01))
+
+    with pytest.raises(getent.Timeout):
+        getent.passwd(timeout=0.01)
+    assert len(getent.passwd()) == count
+
+
+def _in_thread(func, timeout=5):
+    """Run `func` in another thread, returns its result or ``None``."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    return result[0] if result else None
+
+
+def test_stream_consumed_by_another_thread():
+    expected = getent.passwd()
+    records = getent.passwd(stream=True)
+    first = next(records)
+    assert [first] + _in_thread(lambda: list(records)) == expected
+    # The cursor was released by the thread that finished the stream
+    assert _in_thread(getent.passwd) == expected
+
+
+def test_streams_take_no_deadline():
+    with pytest.raises(ValueError):
+        getent.passwd(stream=True, timeout=1)
+    expected = getent.passwd()
+    with getent.deadline(0):
+        assert list(getent.passwd(stream=True)) == expected
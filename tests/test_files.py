@@ -0,0 +1,36 @@
+"""Tests for the pure Python files backend."""
+
+import os
+
+import pytest
+
+from getent.files import Files
+
+
+@pytest.fixture
+def root(tmpdir):
+    etc = tmpdir.mkdir('etc')
+    etc.join('passwd').write(
+        'root:x:0:0:root:/root:/bin/sh\n'
+        'bad:x:abc:1:::\n'
+        'alice:x:1000:1000:Alice:/home/alice:/bin/sh\n')
+    etc.join('group').write('bad:x:zz:\nusers:x:100:alice,bob\n')
+    etc.join('shadow').write('bad:!:x:0:99999:7:::\nalice:!:19000::::::\n')
+    etc.join('services').write('bad\t1x/tcp\nssh\t22/tcp\n')
+    etc.join('hosts').write('')
+    return str(tmpdir)
+
+
+def test_malformed_lines_are_skipped(root):
+    files = Files(root)
+    assert [user.name for user in files.passwd()] == ['root', 'alice']
+    assert files.passwd('alice').uid == 1000
+    assert files.passwd('bad') is None
+    assert [group.name for group in files.group()] == ['users']
+    assert [entry.name for entry in files.shadow()] == ['alice']
+    assert [service.name for service in files.service()] == ['ssh']
+
+
+def test_empty_file(root):
+    assert os.path.getsize(os.path.join(root, 'etc', 'hosts')) == 0
+    assert Files(root).host() == []
@@ -0,0 +1,144 @@
+"""Tests for the netgroup index, against a fake netgroup source."""
+
+import pytest
+
+from getent.netgroups import NetgroupIndex
+
+NETGROUPS = {
+    'trusted': (('db1', 'alice', None),
+                ('Web1.Example.com', 'bob', 'example.com')),
+    'admins': ((None, 'root', None),),
+    'web': (('web1.example.com', None, 'EXAMPLE.com'),),
+    'empty': (),
+}
+
+
+class Netgroup(object):
+
+    def __init__(self, members):
+        self.members = tuple(members)
+
+
+class Source(object):
+
+    """Stand-in for :mod:`getent`, that records the netgroups expanded."""
+
+    def __init__(self, netgroups):
+        self.netgroups = dict(netgroups)
+        self.expanded = []
+
+    def netgroup(self, name):
+        self.expanded.append(name)
+        return Netgroup(self.netgroups.get(name, ()))
+
+
+class Clock(object):
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def source():
+    return Source(NETGROUPS)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def index(source, clock):
+    return NetgroupIndex(sorted(NETGROUPS), ttl=10, source=source,
+                         clock=clock)
+
+
+def test_contains(index):
+    assert index.contains('trusted', host='db1', user='alice')
+    assert not index.contains('trusted', host='db1', user='bob')
+    # A wildcard member matches any key
+    assert index.contains('trusted', user='alice', domain='example.org')
+    assert index.contains('admins', host='anywhere', user='root')
+    assert not index.contains('admins', user='alice')
+    assert not index.contains('empty')
+    assert index.contains('web')
+
+
+def test_case_folding(index):
+    assert index.contains('trusted', host='DB1', user='alice')
+    assert index.contains('web', host='WEB1.example.COM', domain='example.com')
+    # Users are compared as is
+    assert not index.contains('trusted', user='Alice')
+    # Members are returned as NSS has them
+    assert index.members('trusted', host='web1.example.com') == (
+        ('Web1.Example.com', 'bob', 'example.com'),)
+
+
+def test_members(index):
+    assert index.members('trusted') == NETGROUPS['trusted']
+    assert index.members('trusted', user='bob') == (NETGROUPS['trusted'][1],)
+    assert index.members('admins', host='db1') == NETGROUPS['admins']
+    assert index.members('trusted', user='carol') == ()
+
+
+def test_netgroups(index):
+    assert index.netgroups() == ['admins', 'trusted', 'web']
+    assert index.netgroups(host='WEB1.example.com') == [
+        'admins', 'trusted', 'web']
+    assert index.netgroups(user='alice') == ['trusted', 'web']
+    assert index.netgroups(domain='example.com') == ['admins', 'trusted',
+                                                     'web']
+
+
+def test_netgroups_of_several_fields(index):
+    # Every key has to match the same member
+    assert index.netgroups(host='db1', user='alice') == ['trusted']
+    assert index.netgroups(host='db1', user='bob') == []
+    assert index.netgroups(host='anywhere', user='root') == ['admins']
+    assert index.netgroups(host='web1.example.com', user='bob',
+                           domain='example.com') == ['trusted', 'web']
+
+
+def test_update_replaces_one_netgroup(index, source):
+    source.netgroups['trusted'] = (('db2', 'carol', None),)
+    assert index.update('trusted').members == (('db2', 'carol', None),)
+
+    assert not index.contains('trusted', host='db1')
+    assert index.netgroups(user='alice') == ['web']
+    assert index.netgroups(user='carol') == ['trusted', 'web']
+    assert index.netgroups(host='db2', user='carol') == ['trusted']
+    assert index.netgroups(user='root') == ['admins', 'web']
+
+
+def test_expiry(index, source, clock):
+    source.expanded[:] = []
+    clock.now += 5
+    assert index.contains('trusted', user='alice')
+    assert source.expanded == []
+
+    clock.now += 5
+    assert index.contains('trusted', user='alice')
+    assert source.expanded == ['trusted']
+    # The others expired as well, and are expanded before a reverse lookup
+    assert index.netgroups(user='root') == ['admins', 'web']
+    assert sorted(source.expanded) == sorted(NETGROUPS)
+
+
+def test_unknown_netgroups_are_expanded_on_first_use(index, source):
+    assert 'other' not in index.names
+    assert not index.contains('other', user='alice')
+    assert source.expanded[-1] == 'other'
+    assert 'other' in index.names
+
+
+def test_invalidate(index, source):
+    index.invalidate('admins')
+    assert index.names == ('empty', 'trusted', 'web')
+    assert index.netgroups(user='root') == ['web']
+    index.invalidate()
+    assert index.names == ()
+    assert index.netgroups() == []
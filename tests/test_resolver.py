@@ -0,0 +1,144 @@
+"""Tests for batched host resolution, against ``/etc/hosts``.
+
+Names that should not resolve in time are held back from libc by stand-ins
+for the ``getaddrinfo_a`` functions, which report them as in progress.
+"""
+
+import time
+from ctypes import POINTER
+
+import pytest
+
+from getent import convert23, resolver
+from getent.constants import EAI_CANCELED, EAI_INPROGRESS, EAI_NOTCANCELED
+from getent.headers import GaicbStruct
+
+pytestmark = pytest.mark.skipif(not resolver.available(),
+                                reason='getaddrinfo_a is not available')
+
+# Slack for scheduling, on top of a timeout
+SLACK = 0.25
+
+
+class Hanging(object):
+
+    """Stand-ins for the ``getaddrinfo_a`` functions.
+
+    Names in :attr:`names` are never submitted to libc, and stay in
+    progress until they are removed. All names submitted are recorded in
+    :attr:`submitted`.
+    """
+
+    def __init__(self):
+        self.names = set()
+        self.submitted = []
+        self.cancel = EAI_CANCELED
+        self._getaddrinfo_a = resolver.getaddrinfo_a
+        self._gai_error = resolver.gai_error
+        self._gai_cancel = resolver.gai_cancel
+
+    def _pending(self, request):
+        return convert23(request.contents.name) in self.names
+
+    def getaddrinfo_a(self, mode, items, count, sigevent):
+        items = list(items[:count])
+        self.submitted.extend(convert23(item.contents.name)
+                              for item in items)
+        items = [item for item in items if not self._pending(item)]
+        if not items:
+            return 0
+        return self._getaddrinfo_a(
+            mode, (POINTER(GaicbStruct) * len(items))(*items),
+            len(items), sigevent)
+
+    def gai_error(self, request):
+        if self._pending(request):
+            return EAI_INPROGRESS
+        return self._gai_error(request)
+
+    def gai_suspend(self, items, count, timeout):
+        time.sleep(0.01)
+        return 0
+
+    def gai_cancel(self, request):
+        if self._pending(request):
+            return self.cancel
+        return self._gai_cancel(request)
+
+
+@pytest.fixture
+def hanging(monkeypatch):
+    hanging = Hanging()
+    for name in ('getaddrinfo_a', 'gai_error', 'gai_suspend', 'gai_cancel'):
+        monkeypatch.setattr(resolver, name, getattr(hanging, name))
+    return hanging
+
+
+def test_localhost():
+    hosts = resolver.resolve_many(['localhost'], timeout=5,
+                                  family=resolver.AF_INET)
+    assert hosts['localhost'].addresses == ('127.0.0.1',)
+    assert hosts['localhost'].addrtype == resolver.AF_INET
+
+
+def test_unresolvable_name():
+    hosts = resolver.resolve_many(['nosuchhost.invalid', 'localhost'],
+                                  timeout=5)
+    assert hosts['nosuchhost.invalid'] is None
+    assert hosts['localhost'] is not None
+
+
+def test_duplicates_are_resolved_once(hanging):
+    hosts = resolver.resolve_many(['localhost'] * 3, timeout=5)
+    assert list(hosts) == ['localhost']
+    assert hanging.submitted == ['localhost']
+
+
+def test_batches(hanging):
+    names = ['localhost', 'nosuchhost.invalid', 'localhost']
+    hosts = resolver.resolve_many(names, timeout=5, batch_size=1)
+    assert sorted(hosts) == sorted(set(names))
+    assert sorted(hanging.submitted) == sorted(set(names))
+
+
+def test_timeout_leaves_pending_names_out(hanging):
+    hanging.names.add('slow.example')
+    start = time.time()
+    hosts = resolver.resolve_many(['slow.example', 'localhost'],
+                                  timeout=0.2)
+    assert 0.2 <= time.time() - start < 0.2 + SLACK
+    assert hosts['slow.example'] is None
+    assert '127.0.0.1' in hosts['localhost'].addresses
+    assert not resolver._abandoned
+
+
+def test_requests_that_can_not_be_cancelled(hanging):
+    hanging.names.add('slow.example')
+    hanging.cancel = EAI_NOTCANCELED
+    hosts = resolver.resolve_many(['slow.example'], timeout=0.05)
+    assert hosts == {'slow.example': None}
+    assert len(resolver._abandoned) == 1
+
+    # Once libc is done with them, the next call frees them
+    hanging.names.clear()
+    resolver.resolve_many(['localhost'], timeout=5)
+    assert not resolver._abandoned
+
+
+def test_reverse_lookups_that_are_not_reentrant(monkeypatch):
+    delays = {'slow': 0.3, 'fast': 0}
+    running, most = [], []
+
+    def reverse(key):
+        running.append(key)
+        most.append(len(running))
+        time.sleep(delays[key])
+        running.remove(key)
+        return key
+
+    monkeypatch.setattr(resolver, '_reverse', reverse)
+    monkeypatch.setattr(resolver._reentrant, 'available', lambda name: False)
+    hosts = resolver._reverse_all(['slow', 'fast'], 0.1, 8, None)
+    assert hosts == {'slow': None, 'fast': 'fast'}
+    # The timed out lookup was not run alongside another one
+    assert max(most) == 1
@@ -0,0 +1,74 @@
+"""Tests for persistent snapshots, written from a files fixture."""
+
+import os
+
+import pytest
+
+from getent import store
+from getent.files import Files
+
+
+@pytest.fixture
+def root(tmpdir):
+    etc = tmpdir.mkdir('etc')
+    etc.join('passwd').write(
+        'root:x:0:0:root:/root:/bin/sh\n'
+        'alice:x:1000:1000:Alice:/home/alice:/bin/sh\n')
+    etc.join('group').write('root:x:0:\nusers:x:100:alice,bob\n')
+    etc.join('services').write('ssh\t22/tcp\nhttp\t80/tcp\twww\n')
+    etc.join('hosts').write(
+        '127.0.0.1\tlocalhost\n'
+        '10.0.0.1\tdb1.example.com db1\n'
+        '::1\tlocalhost6\n')
+    return str(tmpdir)
+
+
+@pytest.fixture
+def sources(root):
+    return dict((database, (os.path.join(root, 'etc', database),))
+                for database in store.DATABASES)
+
+
+@pytest.fixture
+def path(root):
+    return os.path.join(root, 'getent.db')
+
+
+def test_round_trip(root, sources, path):
+    files = Files(root)
+    store.write(path, source=files, sources=sources)
+    with store.Store(path) as snapshot:
+        assert snapshot.databases == list(store.DATABASES)
+        assert snapshot.passwd() == files.passwd()
+        assert snapshot.passwd('alice') == files.passwd('alice')
+        assert snapshot.passwd(1000).name == 'alice'
+        assert snapshot.passwd('nobody') is None
+        assert snapshot.group(100).members == ('alice', 'bob')
+        assert snapshot.group('root').gid == 0
+        assert snapshot.service(22).name == 'ssh'
+        assert snapshot.service('www', 'tcp').port == 80
+        assert snapshot.service('80/udp') is None
+        assert snapshot.host('10.0.0.1').name == 'db1.example.com'
+        assert snapshot.host('DB1').addresses == ('10.0.0.1',)
+        assert snapshot.host('0:0::1').name == 'localhost6'
+
+
+def test_stale_after_touching_a_source(root, sources, path):
+    store.write(path, source=Files(root), sources=sources)
+    with store.Store(path) as snapshot:
+        assert not snapshot.stale()
+        os.utime(sources['group'][0], (1, 1))
+        assert snapshot.stale()
+
+
+def test_load_writes_again_on_another_generation(root, sources, path):
+    files = Files(root)
+    store.write(path, source=files, generation=1, sources=sources)
+    with store.load(path, generation=1, source=files) as snapshot:
+        assert snapshot.generation == 1
+    inode = os.stat(path).st_ino
+
+    with store.load(path, generation=2, source=files) as snapshot:
+        assert snapshot.generation == 2
+        assert snapshot.passwd('alice').uid == 1000
+    assert os.stat(path).st_ino != inode
@@ -0,0 +1,47 @@
+"""Tests for lookups in worker processes."""
+
+import time
+
+import pytest
+
+import getent
+from getent.workers import WorkerPool
+
+
+def slow(function, delay):
+    def call(*args):
+        time.sleep(delay)
+        return function(*args)
+    return call
+
+
+@pytest.fixture
+def pool():
+    with WorkerPool(size=2, timeout=5) as pool:
+        yield pool
+
+
+def test_call_and_enumerate(pool):
+    assert pool.call('passwd', 0) == getent.passwd(0)
+    assert list(pool.enumerate('passwd')) == getent.passwd()
+    assert pool.enumerate_many(['group', 'proto']) == {
+        'group': getent.group(), 'proto': getent.proto()}
+
+
+def test_timeout_replaces_worker(monkeypatch):
+    monkeypatch.setattr(getent, 'getpwnam', slow(getent.getpwnam, 10))
+    with WorkerPool(size=1) as pool:
+        with pytest.raises(getent.Timeout):
+            pool.call('passwd', 'root', timeout=0.1)
+        assert pool.call('passwd', 0, timeout=5).name == 'root'
+
+
+def test_workers_do_not_inherit_cursor_locks(monkeypatch):
+    expected = getent.passwd()
+    monkeypatch.setattr(getent, 'getpwent', slow(getent.getpwent, 0.05))
+    # Leaves a thread behind that holds the passwd cursor for a while
+    with pytest.raises(getent.Timeout):
+        getent.passwd(timeout=0.01)
+
+    with WorkerPool(size=1, timeout=len(expected) * 0.05 + 5) as pool:
+        assert list(pool.enumerate('passwd')) == expected